@@ -0,0 +1,101 @@
+# Active-permit interval index: how many permits are under way in a zone on a day.
+# A permit is active from its issuance date to its expiration date, both included.
+# Point lookups (e.g. one per complaint) binary-search the sorted start and end
+# days of each zone: the permits active on day d are those started on or before d
+# minus those that expired before d. The full zone x day table is a sweep line: +1
+# on each start day and -1 the day after each expiration are bincounted into a delta
+# matrix whose running sum along the days is the active count. Neither loops over
+# permits x days.
+
+import numpy as np
+import pandas as pd
+from profiling import profiled
+
+# Day numbers are offset so that (zone, day) pairs pack into one sortable int64 key
+_DAY_BITS = 21
+_DAY_OFFSET = 2 ** (_DAY_BITS - 1)
+
+
+def _day_numbers(dates):
+    """Days since 1970-01-01 as float64, NaN for missing dates."""
+    dates = pd.to_datetime(pd.Series(dates)).astype('datetime64[s]')
+    days = dates.to_numpy().astype('int64') // 86400
+    return np.where(dates.isna().to_numpy(), np.nan, days)
+
+
+class ActivePermits:
+    """
+    Permits active per zone and day, from one zone label and start/end date per
+    permit. Permits without a zone or an end date are left out, and a missing
+    start date falls back to `fallback_start` when given (e.g. the filing date).
+    """
+
+    def __init__(self, zone, start, end, fallback_start=None):
+        zone = pd.Series(zone).astype('string')
+        self.name = zone.name or 'zone'
+        has_zone = zone.notna().to_numpy()
+        start = _day_numbers(start)
+        if fallback_start is not None:
+            start = np.where(np.isnan(start), _day_numbers(fallback_start), start)
+        end = _day_numbers(end)
+        keep = has_zone & ~np.isnan(start) & ~np.isnan(end) & (end >= start)
+
+        self.zones, zone_code = np.unique(zone[keep].to_numpy(dtype=object).astype(str), return_inverse=True)
+        self.n_permits = int(keep.sum())
+        self._starts = np.sort(self._key(zone_code, start[keep]))
+        self._ends = np.sort(self._key(zone_code, end[keep]))
+
+    @classmethod
+    def from_frame(cls, permits, zone_col='BOROUGH', start_col='Issuance Date', end_col='Expiration Date',
+                   fallback_col='Filing Date'):
+        """Index of a permit frame, e.g. load_dataset('urban') or with a zone column from zones.py."""
+        fallback = permits[fallback_col] if fallback_col in permits.columns else None
+        return cls(permits[zone_col], permits[start_col], permits[end_col], fallback_start=fallback)
+
+    @staticmethod
+    def _key(zone_code, day):
+        return (np.asarray(zone_code, dtype='int64') << _DAY_BITS) + (np.asarray(day, dtype='int64') + _DAY_OFFSET)
+
+    @profiled()
+    def at(self, zone, dates):
+        """
+        Number of permits active in each (zone, date) pair, e.g. the zone and date
+        of every complaint, as float64; NaN where the date is missing, 0 for zones
+        without permits.
+        """
+        zone = pd.Series(zone).astype('string')
+        zone_code = pd.Index(self.zones).get_indexer(zone.fillna('').to_numpy(dtype=object))
+        day = _day_numbers(dates)
+        valid = (zone_code >= 0) & ~np.isnan(day)
+        key = self._key(zone_code[valid], day[valid])
+
+        # Both arrays hold every permit of the zone once, so the counts of the lower
+        # zones cancel out: started by day d minus expired before day d
+        active = np.where(np.isnan(day), np.nan, 0.0)
+        active[valid] = np.searchsorted(self._starts, key, side='right') - np.searchsorted(self._ends, key, side='left')
+        return active
+
+    @profiled()
+    def daily(self, start='2016-01-01', end='2019-12-31'):
+        """Zone x day frame of active permits for every day from `start` to `end`."""
+        days = pd.date_range(start, end, freq='D')
+        first = int(_day_numbers(days[:1])[0])
+        n_days = len(days)
+        zone_code = self._starts >> _DAY_BITS
+        start_day = (self._starts & (2 ** _DAY_BITS - 1)) - _DAY_OFFSET - first
+        end_zone = self._ends >> _DAY_BITS
+        end_day = (self._ends & (2 ** _DAY_BITS - 1)) - _DAY_OFFSET - first + 1
+
+        # Intervals are clipped to the range: a permit started earlier is active from
+        # the first day, and one expiring later never leaves it
+        width = n_days + 1
+        opened = np.bincount(zone_code * width + np.clip(start_day, 0, n_days), minlength=len(self.zones) * width)
+        closed = np.bincount(end_zone * width + np.clip(end_day, 0, n_days), minlength=len(self.zones) * width)
+        deltas = (opened - closed).reshape(len(self.zones), width)
+        active = np.cumsum(deltas, axis=1)[:, :n_days]
+        return pd.DataFrame(active.astype('int32'), index=pd.Index(self.zones, name=self.name), columns=days)
+
+    def monthly(self, start='2016-01-01', end='2019-12-31'):
+        """Zone x month frame of the average number of permits active per day of the month."""
+        daily = self.daily(start, end)
+        return daily.T.groupby(daily.columns.to_period('M')).mean().T
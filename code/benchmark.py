@@ -0,0 +1,229 @@
+# Stage benchmark suite on synthetic NYC-scale data.
+# For each size a deterministic synthetic complaint extract and permit file are
+# written (see synthetic.py), and every analysis stage is run on them with the
+# project's engines: cleaning, clustering + redundancy, grid/Moran, STA correlation,
+# network build and modeling. Each stage runs in a fresh worker process so its
+# wall time, CPU time and peak memory are its own. The results are written as JSON
+# named after the current commit, so runs can be diffed across commits.
+#
+# Usage: python benchmark.py [size ...]   (defaults to SIZES)
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+from activity import ActivePermits
+from autocorrelation import Moran, MoranLocal, knn_weights
+from bipartite import incidence_matrix, project, redundancy, weighted_clustering
+from correlation import correlation_significance, lagged_correlation
+from cube import CountCube
+from grid import Grid
+from ingest import iter_chunks
+from knox import offense_knox
+from parallel import process_pool, shared_array
+from profiling import measure
+from spatial import calculate_redundancy
+from st_join import crimes_near_permits
+from store import CODE_DIR, load_dataset, write_store
+from synthetic import CRIME_COLUMNS, PERMIT_COLUMNS, write_synthetic_csv
+from training import collapse_rare, design_matrix, fill_category, standardize_columns, train_classifiers
+
+SIZES = [100000, 1000000, 10000000]  # complaint rows
+PERMITS_PER_COMPLAINT = 0.2
+OUT_OF_WINDOW = 0.1  # share of raw complaints dated before 2016, dropped by cleaning
+SEED = 42
+CHUNK_SIZE = 1000000
+OUTPUT_DIR = os.path.normpath(os.path.join(CODE_DIR, '..', 'benchmarks'))
+
+# Stage parameters (kept small enough that the largest size finishes in a nightly run)
+K = 5
+MORAN_PERMUTATIONS = 99
+STA_RESAMPLES = 1000
+KNOX_PERMUTATIONS = 19
+
+
+# ====================
+# Stages
+# ====================
+# Each stage returns (rows in, rows out).
+
+def stage_cleaning(ctx):
+    crime_cube, urban_cube = CountCube('crime'), CountCube('urban')
+    rows_out = 0
+    crime_chunks = iter_chunks(ctx['crime_csv'], CRIME_COLUMNS, 'CMPLNT_FR_DT', '2016-01-01', '2019-12-31',
+                               chunksize=CHUNK_SIZE)
+    for i, chunk in enumerate(crime_chunks):
+        write_store(chunk, 'crime', part=i, path=ctx['crime_store'])
+        crime_cube.append(chunk)
+        rows_out += len(chunk)
+    urban_chunks = iter_chunks(ctx['urban_csv'], PERMIT_COLUMNS, 'Filing Date', '2016-01-01', '2019-12-31',
+                               date_columns=['Filing Date', 'Issuance Date', 'Expiration Date'], chunksize=CHUNK_SIZE)
+    for i, chunk in enumerate(urban_chunks):
+        write_store(chunk, 'urban', part=i, path=ctx['urban_store'])
+        urban_cube.append(chunk)
+        rows_out += len(chunk)
+    crime_cube.save(ctx['crime_cube'])
+    urban_cube.save(ctx['urban_cube'])
+    return ctx['n_crime'] + ctx['n_urban'], rows_out
+
+
+def stage_clustering(ctx):
+    rows = 0
+    for name, lat_col, lon_col, date_col in [('crimes', 'Latitude', 'Longitude', 'CMPLNT_FR_DT'),
+                                             ('permits', 'LATITUDE', 'LONGITUDE', 'Filing Date')]:
+        data = shared_array(name).dropna(subset=[lat_col, lon_col])
+        features = np.column_stack([data[lat_col], data[lon_col], data[date_col].dt.year])
+        labels = KMeans(n_clusters=K, random_state=42).fit_predict(StandardScaler().fit_transform(features))
+        calculate_redundancy(data.assign(Cluster=labels), cluster_column='Cluster', lat_col=lat_col, lon_col=lon_col)
+        rows += len(data)
+    return len(shared_array('crimes')) + len(shared_array('permits')), rows
+
+
+def stage_grid_moran(ctx):
+    crimes = shared_array('crimes').dropna(subset=['Latitude', 'Longitude'])
+    permits = shared_array('permits').dropna(subset=['LATITUDE', 'LONGITUDE'])
+    grid = Grid.from_points(crimes['Longitude'], crimes['Latitude'], resolution=0.01)
+    counts = grid.count_layers({
+        'crime_count': (crimes['Longitude'], crimes['Latitude']),
+        'urban_count': (permits['LONGITUDE'], permits['LATITUDE']),
+    })
+    cells = grid.to_frame(counts)
+    w = knn_weights(cells[['x_center', 'y_center']], k=8)
+    Moran(cells['crime_count'], w, permutations=MORAN_PERMUTATIONS)
+    MoranLocal(cells['crime_count'], w, permutations=MORAN_PERMUTATIONS)
+    return len(crimes) + len(permits), len(cells)
+
+
+def stage_sta_correlation(ctx):
+    crime_by_month = CountCube.load('crime', ctx['crime_cube']).monthly_matrix('BORO_NM')
+    urban_by_month = CountCube.load('urban', ctx['urban_cube']).monthly_matrix('BOROUGH')
+    lagged_correlation(urban_by_month, crime_by_month, lags=range(0, 25))
+    correlation_significance(urban_by_month, crime_by_month, n_resamples=STA_RESAMPLES, block_length=3)
+    permits, crimes = shared_array('permits'), shared_array('crimes')
+    near = crimes_near_permits(permits, crimes)
+    return len(permits) + len(crimes), len(near)
+
+
+def stage_network(ctx):
+    crimes = shared_array('crimes')
+    counts = CountCube.load('crime', ctx['crime_cube']).rollup(['OFNS_DESC', 'BORO_NM']).reset_index(name='count')
+    located = crimes.dropna(subset=['Latitude', 'Longitude'])
+    grid = Grid.from_points(located['Longitude'], located['Latitude'], resolution=0.01)
+    cell_counts = (located.assign(LOCATION=grid.cell_index(located['Longitude'], located['Latitude']))
+                   .groupby(['OFNS_DESC', 'LOCATION'], observed=True).size().reset_index(name='count'))
+    for level_counts, location in [(counts, 'BORO_NM'), (cell_counts, 'LOCATION')]:
+        incidence, _, _ = incidence_matrix(level_counts, 'OFNS_DESC', location)
+        projection = project(incidence)
+        weighted_clustering(projection)
+        redundancy(projection)
+    _, pairs = offense_knox(crimes, permutations=KNOX_PERMUTATIONS)
+    return len(crimes), len(pairs)
+
+
+def stage_modeling(ctx):
+    crimes = shared_array('crimes')
+    active_permits = ActivePermits.from_frame(shared_array('permits'))
+    data = pd.DataFrame({
+        'BORO_NM': crimes['BORO_NM'], 'LAW_CAT_CD': crimes['LAW_CAT_CD'], 'PREM_TYP_DESC': crimes['PREM_TYP_DESC'],
+        'active_projects': active_permits.at(crimes['BORO_NM'], crimes['CMPLNT_FR_DT']),
+        'DayOfWeek': crimes['CMPLNT_FR_DT'].dt.dayofweek,
+    })
+    y = collapse_rare(fill_category(crimes['OFNS_DESC'], 'UNKNOWN'), 50).astype('category').cat.codes.to_numpy()
+    numeric = ['active_projects', 'DayOfWeek']
+    X, _ = design_matrix(data, ['BORO_NM', 'LAW_CAT_CD', 'PREM_TYP_DESC'], numeric, cache=False)
+    X_scaled = standardize_columns(X, range(X.shape[1] - len(numeric), X.shape[1]))
+    # The MLP of modeling.py is left out: its cost is set by max_iter, not by the data size
+    train_classifiers({'Naive Bayes': (MultinomialNB(), 'unscaled'),
+                       'Decision Tree': (DecisionTreeClassifier(random_state=42), 'scaled')},
+                      {'unscaled': X, 'scaled': X_scaled}, y)
+    return len(crimes), int(round(len(y) * 0.2))
+
+
+STAGES = {
+    'clustering': stage_clustering,
+    'grid_moran': stage_grid_moran,
+    'sta_correlation': stage_sta_correlation,
+    'network': stage_network,
+    'modeling': stage_modeling,
+}
+
+
+def _run_stage(name, ctx):
+    func = stage_cleaning if name == 'cleaning' else STAGES[name]
+    (rows_in, rows_out), stats = measure(func, ctx)
+    return {'stage': name, 'rows_in': int(rows_in), 'rows_out': int(rows_out), **stats}
+
+
+def run_isolated(name, ctx, shared=None):
+    """Run one stage in a fresh worker process (inheriting `shared`) and return its measurements."""
+    with process_pool(max_workers=1, shared=shared, threads_per_worker=None) as pool:
+        return pool.submit(_run_stage, name, ctx).result()
+
+
+def benchmark_size(n, workdir):
+    n_urban = int(n * PERMITS_PER_COMPLAINT)
+    ctx = {
+        'n_crime': n, 'n_urban': n_urban,
+        'crime_csv': os.path.join(workdir, 'Book1.csv'), 'urban_csv': os.path.join(workdir, 'Book2.csv'),
+        'crime_store': os.path.join(workdir, 'crime_store'), 'urban_store': os.path.join(workdir, 'urban_store'),
+        'crime_cube': os.path.join(workdir, 'crime_cube.parquet'),
+        'urban_cube': os.path.join(workdir, 'urban_cube.parquet'),
+    }
+    write_synthetic_csv('crime', n, ctx['crime_csv'], chunk_size=CHUNK_SIZE, seed=SEED, out_of_window=OUT_OF_WINDOW)
+    write_synthetic_csv('urban', n_urban, ctx['urban_csv'], chunk_size=CHUNK_SIZE, seed=SEED + 1)
+
+    results = [run_isolated('cleaning', ctx)]
+    (crimes, permits), stats = measure(lambda: (load_dataset('crime', path=ctx['crime_store']),
+                                                load_dataset('urban', path=ctx['urban_store'])))
+    results.append({'stage': 'load', 'rows_in': len(crimes) + len(permits), 'rows_out': len(crimes) + len(permits),
+                    **stats})
+    shared = {'crimes': crimes, 'permits': permits}
+    for name in STAGES:
+        results.append(run_isolated(name, ctx, shared))
+    for result in results:
+        result['size'] = n
+        print(f"{n:>10,} {result['stage']:<16} {result['wall_s']:9.2f}s wall {result['cpu_s']:9.2f}s cpu "
+              f"{result['peak_rss_mb']:9.1f} MB", flush=True)
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=CODE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+sizes = [int(size) for size in sys.argv[1:]] or SIZES
+commit = _commit()
+results = []
+for size in sizes:
+    with tempfile.TemporaryDirectory() as workdir:
+        results += benchmark_size(size, workdir)
+
+report = {
+    'commit': commit,
+    'python': platform.python_version(),
+    'machine': platform.machine(),
+    'cpu_count': os.cpu_count(),
+    'seed': SEED,
+    'results': [{key: result[key] for key in ['size', 'stage', 'rows_in', 'rows_out', 'wall_s', 'cpu_s',
+                                              'peak_rss_mb']} for result in results],
+}
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+output_path = os.path.join(OUTPUT_DIR, f'benchmark_{commit}.json')
+with open(output_path, 'w') as f:
+    json.dump(report, f, indent=2)
+
+print()
+print(pd.DataFrame(report['results']).set_index(['size', 'stage']).round(2).to_string())
+print(f"\nBenchmark results written to '{output_path}'")
@@ -3,17 +3,21 @@
 # https://www.kaggle.com/code/brunacmendes/new-york-crime-analysis/notebook
 
 import pandas as pd
+from ingest import iter_chunks, stream_sample
+from store import write_store
+from cube import CountCube
+from profiling import rows_out, step
+
+# Streaming mode reads the raw CSVs in bounded-size chunks, so peak memory is set
+# by CHUNK_SIZE instead of the size of the full complaint history
+STREAMING = True
+CHUNK_SIZE = 500000
+STRATIFY = False  # Stratify the streamed sample by borough and year
+SAMPLE_SIZE = 100000
 
 file_path = "Book1.csv"
-crime_df = pd.read_csv(file_path, low_memory=False)
 
-# Step 1: Convert CMPLNT_FR_DT to datetime
-crime_df['CMPLNT_FR_DT'] = pd.to_datetime(crime_df['CMPLNT_FR_DT'], errors='coerce')
-
-# Step 2: Filter data to include only complaints from 2016 to 2019
-df_filtered = crime_df[(crime_df['CMPLNT_FR_DT'] >= '2016-01-01') & (crime_df['CMPLNT_FR_DT'] <= '2019-12-31')]
-
-# Step 3: Define essential columns
+# Step 1: Define essential columns
 essential_columns = [
     'BORO_NM',  # Borough name
     'Latitude',  # Latitude for geographic analysis
@@ -28,37 +32,58 @@ essential_columns = [
     'VIC_SEX',  # Victim's gender
 ]
 
-# Step 4: Filter the DataFrame to keep only the essential columns
-filtered_crime_df = df_filtered[essential_columns]
+step("Steps 2-5: Read, filter and sample the complaints")
+if STREAMING:
+    # Step 2: Read only the essential columns chunk by chunk, keeping complaints from 2016 to 2019
+    def crime_chunks():
+        return iter_chunks(file_path, essential_columns, 'CMPLNT_FR_DT',
+                           '2016-01-01', '2019-12-31', chunksize=CHUNK_SIZE)
 
-# Step 5: Randomly pick 100,000 rows
-if len(filtered_crime_df) > 100000:
-    sampled_crime_df = filtered_crime_df.sample(n=100000, random_state=42)
+    # Step 3: Draw the 100,000 rows with a reservoir sample (stratified, a first pass counts the strata)
+    strata = ['BORO_NM', lambda chunk: chunk['CMPLNT_FR_DT'].dt.year] if STRATIFY else None
+    sampled_crime_df = stream_sample(crime_chunks, SAMPLE_SIZE, strata=strata, seed=42)
 else:
-    sampled_crime_df = filtered_crime_df  # If less than 100k rows, use all rows
+    crime_df = pd.read_csv(file_path, low_memory=False)
+
+    # Step 2: Convert CMPLNT_FR_DT to datetime
+    crime_df['CMPLNT_FR_DT'] = pd.to_datetime(crime_df['CMPLNT_FR_DT'], errors='coerce')
+
+    # Step 3: Filter data to include only complaints from 2016 to 2019
+    df_filtered = crime_df[(crime_df['CMPLNT_FR_DT'] >= '2016-01-01') & (crime_df['CMPLNT_FR_DT'] <= '2019-12-31')]
+
+    # Step 4: Filter the DataFrame to keep only the essential columns
+    filtered_crime_df = df_filtered[essential_columns]
+
+    # Step 5: Randomly pick 100,000 rows
+    if len(filtered_crime_df) > SAMPLE_SIZE:
+        sampled_crime_df = filtered_crime_df.sample(n=SAMPLE_SIZE, random_state=42)
+    else:
+        sampled_crime_df = filtered_crime_df  # If less than 100k rows, use all rows
 
 # Display the number of rows in the sampled dataset
 print(f"Number of rows in the sampled DataFrame: {len(sampled_crime_df)}")
+rows_out(len(sampled_crime_df))
 
 # Step 6: Save the sampled dataset to a CSV file
+step("Step 6: Save the sampled CSV", rows_in=len(sampled_crime_df))
 sampled_crime_df.to_csv('/kaggle/working/sampled_crime_data.csv', index=False)
 print("Sampled dataset saved as '/kaggle/working/sampled_crime_data.csv'")
 
+# Step 7: Save a Parquet copy partitioned by year and borough for the analysis scripts
+step("Step 7: Save the crime store", rows_in=len(sampled_crime_df))
+write_store(sampled_crime_df, 'crime')
 
+# Step 8: Materialize the crime count cube used by the charts and correlations
+step("Step 8: Build the crime count cube", rows_in=len(sampled_crime_df))
+CountCube.from_rows('crime', sampled_crime_df).save()
 
-# Cleaning of urban dataset
 
-file_path = "../data/Book2.csv"
-urban_df = pd.read_csv(file_path, low_memory=False)
 
-urban_df['Filing Date'] = pd.to_datetime(urban_df['Filing Date'], errors='coerce')
-urban_df['Issuance Date'] = pd.to_datetime(urban_df['Issuance Date'], errors='coerce')
-urban_df['Expiration Date'] = pd.to_datetime(urban_df['Expiration Date'], errors='coerce')
+# Cleaning of urban dataset
+step("Clean the urban dataset")
 
-# Filter data to include only rows from 2016 to 2019
-urban_df = urban_df[
-    (urban_df['Filing Date'] >= '2016-01-01') & (urban_df['Filing Date'] <= '2019-12-31')
-]
+file_path = "../data/Book2.csv"
+urban_date_columns = ['Filing Date', 'Issuance Date', 'Expiration Date']
 
 # Define essential columns for urban development
 essential_columns_urban = [
@@ -77,11 +102,42 @@ essential_columns_urban = [
     'Street Name'
 ]
 
-filtered_urban_df = urban_df[essential_columns_urban]
+output_file_path = "../../Documents/GitHub/urban/filtered_urban_data.csv"
 
-print("Filtered Urban Dataset (First 5 Rows):")
-print(filtered_urban_df.head())
+if STREAMING:
+    # Filter each chunk to 2016-2019 and append it straight to the output file and store
+    urban_chunks = iter_chunks(file_path, essential_columns_urban, 'Filing Date',
+                               '2016-01-01', '2019-12-31', date_columns=urban_date_columns,
+                               chunksize=CHUNK_SIZE)
+    rows_written = 0
+    urban_cube = CountCube('urban')
+    for i, chunk in enumerate(urban_chunks):
+        chunk.to_csv(output_file_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        write_store(chunk, 'urban', part=i)
+        urban_cube.append(chunk)
+        rows_written += len(chunk)
+    urban_cube.save()
+    print(f"Number of rows in the filtered urban dataset: {rows_written}")
+    rows_out(rows_written)
+else:
+    urban_df = pd.read_csv(file_path, low_memory=False)
+
+    for col in urban_date_columns:
+        urban_df[col] = pd.to_datetime(urban_df[col], errors='coerce')
+
+    # Filter data to include only rows from 2016 to 2019
+    urban_df = urban_df[
+        (urban_df['Filing Date'] >= '2016-01-01') & (urban_df['Filing Date'] <= '2019-12-31')
+    ]
+
+    filtered_urban_df = urban_df[essential_columns_urban]
+
+    print("Filtered Urban Dataset (First 5 Rows):")
+    print(filtered_urban_df.head())
+
+    filtered_urban_df.to_csv(output_file_path, index=False)
+    write_store(filtered_urban_df, 'urban')
+    CountCube.from_rows('urban', filtered_urban_df).save()
+    rows_out(len(filtered_urban_df))
 
-output_file_path = "../../Documents/GitHub/urban/filtered_urban_data.csv"
-filtered_urban_df.to_csv(output_file_path, index=False)
 print(f"Filtered urban dataset saved locally as '{output_file_path}'")
@@ -0,0 +1,153 @@
+# Clustering models for clustering.py that go beyond a single in-memory KMeans fit.
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import davies_bouldin_score, silhouette_score
+from sklearn.preprocessing import StandardScaler
+from ingest import iter_chunks
+from parallel import process_pool, shared_array
+
+
+def feature_chunks(file_path, lat_col, lon_col, date_col, chunksize=500000,
+                   start='2016-01-01', end='2019-12-31'):
+    """
+    Yield [Latitude, Longitude, Year] feature blocks from a raw CSV, chunk by chunk,
+    with the same date window and missing-coordinate filtering as the batch path.
+    """
+    for chunk in iter_chunks(file_path, [lat_col, lon_col, date_col], date_col, start, end,
+                             chunksize=chunksize):
+        chunk = chunk.dropna(subset=[lat_col, lon_col])
+        yield np.column_stack([
+            chunk[lat_col].to_numpy(dtype='float64'),
+            chunk[lon_col].to_numpy(dtype='float64'),
+            chunk[date_col].dt.year.to_numpy(dtype='float64'),
+        ])
+
+
+def _batches(X, batch_size):
+    for i in range(0, len(X), batch_size):
+        yield X[i:i + batch_size]
+
+
+def _nearest(Xs, centers):
+    """Index of the nearest centroid for every row."""
+    distances = (
+        (Xs ** 2).sum(axis=1)[:, None]
+        - 2 * Xs @ centers.T
+        + (centers ** 2).sum(axis=1)[None, :]
+    )
+    return distances.argmin(axis=1)
+
+
+def fit_streaming_kmeans(chunks, k, batch_size=10000, n_epochs=1, max_refine_passes=30, tol=1e-4,
+                         random_state=42, cache_dir=None):
+    """
+    Fit KMeans over a stream of feature blocks without holding the data in memory.
+
+    `chunks` is an iterable of (n, d) arrays, e.g. from feature_chunks, and is
+    read only once: its blocks are written to .npy files in a temporary directory
+    (under `cache_dir` if given, about 8 bytes per value) while a StandardScaler
+    is fit incrementally, then standardised in place. Every later pass
+    memory-maps the cached blocks instead of parsing the source again:
+      1. MiniBatchKMeans.partial_fit over mini-batches for `n_epochs`,
+      2. exact Lloyd iterations, accumulating per-cluster sums over the blocks,
+         until the total squared centroid shift falls below `tol` (in scaled
+         units, as for KMeans) or after `max_refine_passes` passes,
+      3. the inertia of the full dataset.
+
+    The refinement converges to a local optimum of the KMeans objective from the
+    mini-batch centroids. That is not necessarily the optimum a batch KMeans fit
+    reaches from its own initialisations, so the inertia only approximately
+    matches the batch path.
+
+    Returns (scaler, model); model.cluster_centers_ are in scaled feature space,
+    model.inertia_ is the full-data inertia and model.n_iter_ the number of
+    refinement passes run.
+    """
+    scaler = StandardScaler()
+    with tempfile.TemporaryDirectory(dir=cache_dir) as workdir:
+        paths = []
+        for X in chunks:
+            if len(X):
+                paths.append(os.path.join(workdir, f'{len(paths)}.npy'))
+                np.save(paths[-1], np.asarray(X, dtype='float64'))
+                scaler.partial_fit(X)
+        for path in paths:
+            np.save(path, scaler.transform(np.load(path)))
+
+        def scaled_blocks():
+            for path in paths:
+                yield np.load(path, mmap_mode='r')
+
+        model = MiniBatchKMeans(n_clusters=k, batch_size=batch_size, random_state=random_state, n_init=3)
+        for _ in range(n_epochs):
+            for Xs in scaled_blocks():
+                for batch in _batches(Xs, batch_size):
+                    # The first call initialises the centroids, so it needs at least k points
+                    if len(batch) >= k or hasattr(model, 'cluster_centers_'):
+                        model.partial_fit(batch)
+
+        centers = model.cluster_centers_.copy()
+        n_passes = 0
+        for n_passes in range(1, max_refine_passes + 1):
+            sums = np.zeros_like(centers)
+            counts = np.zeros(k)
+            for Xs in scaled_blocks():
+                labels = _nearest(Xs, centers)
+                for j in range(Xs.shape[1]):
+                    sums[:, j] += np.bincount(labels, weights=Xs[:, j], minlength=k)
+                counts += np.bincount(labels, minlength=k)
+            # Keep the previous centroid for clusters that lost all their points
+            moved = counts > 0
+            previous = centers.copy()
+            centers[moved] = sums[moved] / counts[moved, None]
+            if ((centers - previous) ** 2).sum() <= tol:
+                break
+        model.cluster_centers_ = centers
+        model.n_iter_ = n_passes
+
+        inertia = 0.0
+        for Xs in scaled_blocks():
+            inertia += float(((Xs - centers[_nearest(Xs, centers)]) ** 2).sum())
+        model.inertia_ = inertia
+    return scaler, model
+
+
+def _fit_k(name, k, silhouette_sample, random_state):
+    X = shared_array(name)
+    model = KMeans(n_clusters=k, random_state=random_state)
+    labels = model.fit_predict(X)
+    return k, {
+        'inertia': model.inertia_,
+        'silhouette': silhouette_score(X, labels, sample_size=min(silhouette_sample, len(X)),
+                                       random_state=random_state),
+        'davies_bouldin': davies_bouldin_score(X, labels),
+    }, labels.astype('int32')
+
+
+def sweep_k(X, ks, silhouette_sample=10000, max_workers=None, random_state=42):
+    """
+    Fit KMeans for every k in `ks` in parallel and score each fit.
+
+    The feature matrix is handed to the worker processes once through
+    parallel.process_pool rather than pickled into every task. Silhouette is
+    computed on a random sample of `silhouette_sample` rows.
+
+    Returns a table indexed by k with inertia, silhouette and Davies-Bouldin,
+    the best k (highest silhouette) and its labels.
+    """
+    X = np.ascontiguousarray(X, dtype='float64')
+    ks = list(ks)
+    rows, labels = {}, {}
+    with process_pool(max_workers=min(max_workers or len(ks), len(ks)), shared={'X': X}) as pool:
+        futures = [pool.submit(_fit_k, 'X', k, silhouette_sample, random_state) for k in ks]
+        for future in futures:
+            k, scores, k_labels = future.result()
+            rows[k] = scores
+            labels[k] = k_labels
+    table = pd.DataFrame.from_dict(rows, orient='index').rename_axis('k')
+    best_k = int(table['silhouette'].idxmax())
+    return table, best_k, labels[best_k]
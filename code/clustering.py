@@ -4,132 +4,201 @@ import matplotlib.pyplot as plt
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 import geopandas as gpd
-from shapely.geometry import Point
-
-# Load datasets
-crime_data = pd.read_csv("sampled_crime_data.csv")
-urban_data = pd.read_csv("filtered_urban_data.csv")
+from matplotlib.patches import Patch
+from store import load_dataset
+from spatial import calculate_redundancy
+from cluster_models import feature_chunks, fit_streaming_kmeans, sweep_k
+from render import RasterCanvas
+from profiling import rows_out, step
+from figures import figure, render_figures
+from zones import load_layer, zone_column
+
+# Streaming mode fits the clusters on the full 2016-2019 complaint and permit
+# history, read chunk by chunk from the raw CSVs, and then labels the samples below
+STREAMING = False
+CRIME_RAW_PATH = "Book1.csv"
+URBAN_RAW_PATH = "../data/Book2.csv"
+CHUNK_SIZE = 500000
+
+# Draw the cluster maps as a binned raster instead of one scatter marker per point
+RASTER_MAPS = True
+
+# Load datasets (only coordinates and date are needed; dates come back parsed)
+step("Load datasets")
+crime_data = load_dataset('crime', columns=['Latitude', 'Longitude', 'CMPLNT_FR_DT'])
+urban_data = load_dataset('urban', columns=['LATITUDE', 'LONGITUDE', 'Filing Date'])
 
 # =====================
 # Preprocess Crime Data
 # =====================
-crime_data['CMPLNT_FR_DT'] = pd.to_datetime(crime_data['CMPLNT_FR_DT'])
+step("Preprocess crime data", rows_in=len(crime_data))
 crime_data['Year'] = crime_data['CMPLNT_FR_DT'].dt.year
 crime_data = crime_data.dropna(subset=['Latitude', 'Longitude'])
 crime_features = crime_data[['Latitude', 'Longitude', 'Year']]
+rows_out(len(crime_features))
 
 # =====================
 # Preprocess Urban Data
 # =====================
-urban_data['Filing Date'] = pd.to_datetime(urban_data['Filing Date'])
+step("Preprocess urban data", rows_in=len(urban_data))
 urban_data['Year'] = urban_data['Filing Date'].dt.year
 urban_data = urban_data.dropna(subset=['LATITUDE', 'LONGITUDE'])
 urban_features = urban_data[['LATITUDE', 'LONGITUDE', 'Year']]
-
-# Standardize the features for clustering
-scaler = StandardScaler()
-crime_scaled = scaler.fit_transform(crime_features)
-urban_scaled = scaler.fit_transform(urban_features)
+rows_out(len(urban_features))
 
 # ===========================
 # Apply K-Means Clustering
 # ===========================
+step("Apply K-Means clustering", rows_in=len(crime_features) + len(urban_features))
 k = 5  # Number of clusters
-
-# Crime Clustering
-kmeans_crime = KMeans(n_clusters=k, random_state=42)
-crime_data['Cluster'] = kmeans_crime.fit_predict(crime_scaled)
-
-# Urban Project Clustering
-kmeans_urban = KMeans(n_clusters=k, random_state=42)
-urban_data['Cluster'] = kmeans_urban.fit_predict(urban_scaled)
+K_RANGE = None  # e.g. range(2, 11) to pick k per dataset with a parallel sweep instead
+k_crime = k_urban = k
+
+if STREAMING:
+    # Scaler and centroids are fit incrementally over the full history of each dataset
+    # Each raw CSV is parsed once; the fit iterates over a temporary .npy cache of its features
+    crime_scaler, kmeans_crime = fit_streaming_kmeans(
+        feature_chunks(CRIME_RAW_PATH, 'Latitude', 'Longitude', 'CMPLNT_FR_DT', chunksize=CHUNK_SIZE), k
+    )
+    urban_scaler, kmeans_urban = fit_streaming_kmeans(
+        feature_chunks(URBAN_RAW_PATH, 'LATITUDE', 'LONGITUDE', 'Filing Date', chunksize=CHUNK_SIZE), k
+    )
+    print(f"Full-data inertia - Crime: {kmeans_crime.inertia_:.2f}, "
+          f"Urban Development: {kmeans_urban.inertia_:.2f}")
+
+    crime_data['Cluster'] = kmeans_crime.predict(crime_scaler.transform(crime_features.to_numpy(dtype='float64')))
+    urban_data['Cluster'] = kmeans_urban.predict(urban_scaler.transform(urban_features.to_numpy(dtype='float64')))
+else:
+    # Standardize the features for clustering, with a separate scaler per dataset
+    crime_scaler = StandardScaler()
+    urban_scaler = StandardScaler()
+    crime_scaled = crime_scaler.fit_transform(crime_features)
+    urban_scaled = urban_scaler.fit_transform(urban_features)
+
+    if K_RANGE is not None:
+        # Fit every k in parallel, score it (inertia, sampled silhouette, Davies-Bouldin)
+        # and keep the labels of the best-scoring k
+        crime_sweep, k_crime, crime_data['Cluster'] = sweep_k(crime_scaled, K_RANGE)
+        urban_sweep, k_urban, urban_data['Cluster'] = sweep_k(urban_scaled, K_RANGE)
+        print("Crime K-Means sweep:\n", crime_sweep)
+        print("Urban Development K-Means sweep:\n", urban_sweep)
+        print(f"Best k - Crime: {k_crime}, Urban Development: {k_urban}")
+    else:
+        # Crime Clustering
+        kmeans_crime = KMeans(n_clusters=k, random_state=42)
+        crime_data['Cluster'] = kmeans_crime.fit_predict(crime_scaled)
+
+        # Urban Project Clustering
+        kmeans_urban = KMeans(n_clusters=k, random_state=42)
+        urban_data['Cluster'] = kmeans_urban.fit_predict(urban_scaled)
 
 # ============================
 # Calculate Redundancy Metrics
 # ============================
+step("Calculate redundancy metrics", rows_in=len(crime_data) + len(urban_data))
 
-def calculate_redundancy(data, cluster_column, lat_col, lon_col):
-    """
-    Calculate redundancy for each cluster based on shared spatial overlap.
-    Redundancy is computed as the average density of points within each cluster
-    relative to its neighbors.
-    """
-    redundancy_scores = {}
-    for cluster in data[cluster_column].unique():
-        # Points in the current cluster
-        cluster_points = data[data[cluster_column] == cluster]
-        cluster_area = len(cluster_points)  # Number of points in this cluster
-
-        # Points in other clusters
-        other_points = data[data[cluster_column] != cluster]
-
-        # Merge based on latitude and longitude to calculate overlaps
-        overlap = cluster_points.merge(
-            other_points,
-            how='inner',
-            left_on=[lat_col, lon_col],
-            right_on=[lat_col, lon_col]
-        ).shape[0]
-
-        # Redundancy as percentage overlap
-        redundancy_scores[cluster] = overlap / cluster_area if cluster_area > 0 else 0
-
-    return redundancy_scores
+# Points count as overlapping when they share a location (optionally rounded to
+# REDUNDANCY_DECIMALS places), or, when REDUNDANCY_RADIUS is set, when they lie
+# within that many metres of a point in another cluster
+REDUNDANCY_DECIMALS = None
+REDUNDANCY_RADIUS = None  # e.g. 50
 
 # Redundancy for Crime Clusters
 crime_redundancy = calculate_redundancy(
-    crime_data, cluster_column='Cluster', lat_col='Latitude', lon_col='Longitude'
+    crime_data, cluster_column='Cluster', lat_col='Latitude', lon_col='Longitude',
+    decimals=REDUNDANCY_DECIMALS, radius=REDUNDANCY_RADIUS
 )
 print("Crime Cluster Redundancy:", crime_redundancy)
 
 # Redundancy for Urban Development Clusters
 urban_redundancy = calculate_redundancy(
-    urban_data, cluster_column='Cluster', lat_col='LATITUDE', lon_col='LONGITUDE'
+    urban_data, cluster_column='Cluster', lat_col='LATITUDE', lon_col='LONGITUDE',
+    decimals=REDUNDANCY_DECIMALS, radius=REDUNDANCY_RADIUS
 )
 print("Urban Development Cluster Redundancy:", urban_redundancy)
 
-# ================================
-# Convert to GeoDataFrames for Map
-# ================================
-crime_gdf = gpd.GeoDataFrame(
-    crime_data,
-    geometry=[Point(xy) for xy in zip(crime_data['Longitude'], crime_data['Latitude'])],
-    crs="EPSG:4326"
-)
-urban_gdf = gpd.GeoDataFrame(
-    urban_data,
-    geometry=[Point(xy) for xy in zip(urban_data['LONGITUDE'], urban_data['LATITUDE'])],
-    crs="EPSG:4326"
-)
+# ============================
+# Cluster Composition per Zone
+# ============================
+# With a polygon layer (police precincts, NTAs, census tracts, ...) every point is
+# tagged with its zone (see zones.py) and the share of each zone's points per cluster
+# is reported
+ZONE_LAYER = None  # e.g. '../data/nyc_precincts.geojson'
+ZONE_ID = 'precinct'
+if ZONE_LAYER:
+    step("Cluster composition per zone", rows_in=len(crime_data) + len(urban_data))
+    zones = load_layer(ZONE_LAYER, ZONE_ID)
+    for label, dataset, data in [('Crime', 'crime', crime_data), ('Urban Development', 'urban', urban_data)]:
+        zone = zone_column(data, dataset, zones, ZONE_ID)
+        composition = pd.crosstab(zone, data['Cluster'], normalize='index')
+        print(f"\n{label} cluster share per {ZONE_ID} ({zone.notna().sum()} of {len(zone)} points in a zone):")
+        print(composition.round(2).to_string())
 
 # ============================
 # Side-by-Side Visualization
 # ============================
-fig, axes = plt.subplots(2, 1, figsize=(10, 18), sharex=True, sharey=True)
-
-# Plot Urban Development Clusters
-ax1 = axes[0]
-urban_colors = ['blue', 'cyan', 'navy', 'purple', 'darkblue']
-for i in range(k):
-    urban_gdf[urban_gdf['Cluster'] == i].plot(
-        ax=ax1, color=urban_colors[i], markersize=5, label=f'Cluster {i}\nRedundancy: {urban_redundancy[i]:.2f}'
-    )
-ax1.set_title('Urban Development Clusters')
-ax1.set_xlabel('Longitude')
-ax1.set_ylabel('Latitude')
-ax1.legend(markerscale=3)
-
-# Plot Crime Clusters
-ax2 = axes[1]
-crime_colors = ['red', 'orange', 'brown', 'darkred', 'salmon']
-for i in range(k):
-    crime_gdf[crime_gdf['Cluster'] == i].plot(
-        ax=ax2, color=crime_colors[i], markersize=1, label=f'Cluster {i}\nRedundancy: {crime_redundancy[i]:.2f}'
-    )
-ax2.set_title('Crime Clusters')
-ax2.set_xlabel('Longitude')
-ax2.legend(markerscale=3)
-
-# Adjust layout
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+@figure('clusters')
+def plot_clusters():
+    fig, axes = plt.subplots(2, 1, figsize=(10, 18), sharex=True, sharey=True)
+    ax1, ax2 = axes
+    urban_colors = ['blue', 'cyan', 'navy', 'purple', 'darkblue']
+    crime_colors = ['red', 'orange', 'brown', 'darkred', 'salmon']
+
+    if RASTER_MAPS:
+        # Bin each dataset into a pixel grid coloured by cluster and draw it as one image
+        urban_canvas = RasterCanvas(n_labels=k_urban).add(urban_data['LONGITUDE'], urban_data['LATITUDE'],
+                                                          labels=urban_data['Cluster'])
+        urban_canvas.draw(ax1, urban_canvas.shade_labels(urban_colors))
+        ax1.legend(handles=[
+            Patch(color=urban_colors[i % len(urban_colors)], label=f'Cluster {i}\nRedundancy: {urban_redundancy[i]:.2f}')
+            for i in range(k_urban)
+        ])
+
+        crime_canvas = RasterCanvas(n_labels=k_crime).add(crime_data['Longitude'], crime_data['Latitude'],
+                                                          labels=crime_data['Cluster'])
+        crime_canvas.draw(ax2, crime_canvas.shade_labels(crime_colors))
+        ax2.legend(handles=[
+            Patch(color=crime_colors[i % len(crime_colors)], label=f'Cluster {i}\nRedundancy: {crime_redundancy[i]:.2f}')
+            for i in range(k_crime)
+        ])
+    else:
+        # ================================
+        # Convert to GeoDataFrames for Map
+        # ================================
+        crime_gdf = gpd.GeoDataFrame(
+            crime_data,
+            geometry=gpd.points_from_xy(crime_data['Longitude'], crime_data['Latitude']),
+            crs="EPSG:4326"
+        )
+        urban_gdf = gpd.GeoDataFrame(
+            urban_data,
+            geometry=gpd.points_from_xy(urban_data['LONGITUDE'], urban_data['LATITUDE']),
+            crs="EPSG:4326"
+        )
+
+        # Plot Urban Development Clusters
+        for i in range(k_urban):
+            urban_gdf[urban_gdf['Cluster'] == i].plot(
+                ax=ax1, color=urban_colors[i % len(urban_colors)], markersize=5, label=f'Cluster {i}\nRedundancy: {urban_redundancy[i]:.2f}'
+            )
+        ax1.legend(markerscale=3)
+
+        # Plot Crime Clusters
+        for i in range(k_crime):
+            crime_gdf[crime_gdf['Cluster'] == i].plot(
+                ax=ax2, color=crime_colors[i % len(crime_colors)], markersize=1, label=f'Cluster {i}\nRedundancy: {crime_redundancy[i]:.2f}'
+            )
+        ax2.legend(markerscale=3)
+
+    ax1.set_title('Urban Development Clusters')
+    ax1.set_xlabel('Longitude')
+    ax1.set_ylabel('Latitude')
+    ax2.set_title('Crime Clusters')
+    ax2.set_xlabel('Longitude')
+
+    # Adjust layout
+    plt.tight_layout()
+
+
+step("Side-by-side visualization", rows_in=len(crime_data) + len(urban_data))
+render_figures()
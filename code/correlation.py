@@ -0,0 +1,172 @@
+# Batched correlation engine for sta.py.
+# Works on group x time count matrices (boroughs, precincts or grid cells by
+# month) and computes Pearson and Spearman correlations for every group at once
+# with NumPy reductions, across a whole range of lags in a single call, plus
+# resampling-based significance batched across worker processes.
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+from parallel import process_pool, shared_array
+from profiling import profiled
+
+
+def monthly_counts(df, group_col, date_col, start='2016-01', end='2019-12'):
+    """
+    Group x month count matrix (DataFrame indexed by group, one column per month
+    Period from `start` to `end`), built with a single bincount.
+    """
+    months = pd.period_range(start, end, freq='M')
+    dates = pd.to_datetime(df[date_col])
+    month_index = (dates.dt.year - months[0].year) * 12 + (dates.dt.month - months[0].month)
+    groups, group_index = np.unique(df[group_col].astype('string').fillna('UNKNOWN').to_numpy(dtype=object),
+                                    return_inverse=True)
+    keep = (month_index >= 0).to_numpy() & (month_index < len(months)).to_numpy()
+    flat = group_index[keep] * len(months) + month_index.to_numpy()[keep].astype('int64')
+    counts = np.bincount(flat, minlength=len(groups) * len(months)).reshape(len(groups), len(months))
+    return pd.DataFrame(counts, index=pd.Index(groups, name=group_col), columns=months)
+
+
+def _rank_rows(X):
+    """Average ranks along each row, ignoring NaNs (which stay NaN)."""
+    missing = np.isnan(X)
+    # Missing values are ranked last, so they do not change the ranks of the others
+    ranks = rankdata(np.where(missing, np.inf, X), axis=1)
+    return np.where(missing, np.nan, ranks)
+
+
+def _row_pearson(x, y):
+    """Pearson correlation of every row pair, over the positions where both are present."""
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    n = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.where(valid, x, 0).sum(axis=1) / n
+        y_mean = np.where(valid, y, 0).sum(axis=1) / n
+        xc = np.where(valid, x - x_mean[:, None], 0)
+        yc = np.where(valid, y - y_mean[:, None], 0)
+        r = (xc * yc).sum(axis=1) / np.sqrt((xc ** 2).sum(axis=1) * (yc ** 2).sum(axis=1))
+    r[n < 2] = np.nan
+    return np.clip(r, -1, 1)
+
+
+def _row_spearman(x, y):
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    return _row_pearson(_rank_rows(np.where(valid, x, np.nan)), _rank_rows(np.where(valid, y, np.nan)))
+
+
+def row_correlation(x, y, method='pearson'):
+    """Correlation of every row of `x` with the same row of `y` (2-D arrays, NaN = missing)."""
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    if method == 'pearson':
+        return _row_pearson(x, y)
+    if method == 'spearman':
+        return _row_spearman(x, y)
+    raise ValueError("Unsupported method")
+
+
+@profiled()
+def lagged_correlation(leading, lagging, lags=range(0, 25), methods=('pearson', 'spearman')):
+    """
+    Correlation surface between two group x time matrices, with `leading`
+    (e.g. permits) ahead of `lagging` (e.g. crime) by each lag in `lags` periods.
+
+    Both inputs are DataFrames with groups as index and time as columns; they are
+    aligned on their common groups and periods. Returns a DataFrame indexed by
+    group with (method, lag) columns.
+    """
+    groups = leading.index.intersection(lagging.index)
+    periods = leading.columns.intersection(lagging.columns)
+    x = leading.loc[groups, periods].to_numpy(dtype='float64')
+    y = lagging.loc[groups, periods].to_numpy(dtype='float64')
+
+    surface = {}
+    for lag in lags:
+        if lag >= len(periods):
+            continue
+        x_lag = x[:, :len(periods) - lag]
+        y_lag = y[:, lag:]
+        for method in methods:
+            surface[(method, lag)] = row_correlation(x_lag, y_lag, method)
+    result = pd.DataFrame(surface, index=groups)
+    result.columns = pd.MultiIndex.from_tuples(result.columns, names=['method', 'lag'])
+    return result
+
+
+# ==========================
+# Resampling significance
+# ==========================
+
+def _block_bootstrap_ids(rng, n_resamples, n_periods, block_length):
+    """Moving-block bootstrap: each resample is a run of random blocks of consecutive periods."""
+    n_blocks = -(-n_periods // block_length)
+    starts = rng.integers(0, n_periods - block_length + 1, size=(n_resamples, n_blocks))
+    ids = (starts[:, :, None] + np.arange(block_length)).reshape(n_resamples, -1)
+    return ids[:, :n_periods]
+
+
+def _block_permutation_ids(rng, n_resamples, n_periods, block_length):
+    """Shuffle the order of blocks of consecutive periods (plain permutation for block_length 1)."""
+    blocks = np.array_split(np.arange(n_periods), -(-n_periods // block_length))
+    order = rng.permuted(np.tile(np.arange(len(blocks)), (n_resamples, 1)), axis=1)
+    return np.array([np.concatenate([blocks[b] for b in row]) for row in order])
+
+
+def _resample_batch(kind, seed, n_resamples, method, block_length):
+    x = shared_array('x')
+    y = shared_array('y')
+    rng = np.random.default_rng(seed)
+    n_groups, n_periods = x.shape
+    if kind == 'bootstrap':
+        ids = _block_bootstrap_ids(rng, n_resamples, n_periods, block_length)
+        x_resampled, y_resampled = x[:, ids], y[:, ids]
+    else:
+        ids = _block_permutation_ids(rng, n_resamples, n_periods, block_length)
+        x_resampled, y_resampled = np.broadcast_to(x[:, None, :], (n_groups, n_resamples, n_periods)), y[:, ids]
+    # Every (group, resample) pair becomes one row of a single batched correlation
+    r = row_correlation(x_resampled.reshape(-1, n_periods), y_resampled.reshape(-1, n_periods), method)
+    return r.reshape(n_groups, n_resamples)
+
+
+@profiled()
+def correlation_significance(leading, lagging, method='pearson', n_resamples=10000, block_length=1,
+                             confidence=0.95, seed=42, batch_size=1000, max_workers=None):
+    """
+    Block-bootstrap confidence intervals and permutation p-values for the
+    correlation of every group of two aligned group x period matrices.
+
+    Resamples are drawn in fixed batches of `batch_size`, each from its own
+    child of `seed`, and the batches run across a process pool, so the results
+    are reproducible whatever the number of workers. `block_length` keeps runs of
+    consecutive periods together to respect autocorrelation in monthly series.
+
+    Returns a frame indexed by group with the observed correlation, the
+    bootstrap interval and the two-sided permutation p-value.
+    """
+    groups = leading.index.intersection(lagging.index)
+    periods = leading.columns.intersection(lagging.columns)
+    x = leading.loc[groups, periods].to_numpy(dtype='float64')
+    y = lagging.loc[groups, periods].to_numpy(dtype='float64')
+    observed = row_correlation(x, y, method)
+
+    block_length = max(1, min(block_length, len(periods)))
+    batches = [batch_size] * (n_resamples // batch_size) + ([n_resamples % batch_size] if n_resamples % batch_size else [])
+    bootstrap_seeds, permutation_seeds = np.random.SeedSequence(seed).spawn(2)
+    tasks = [('bootstrap', s, n) for s, n in zip(bootstrap_seeds.spawn(len(batches)), batches)]
+    tasks += [('permutation', s, n) for s, n in zip(permutation_seeds.spawn(len(batches)), batches)]
+
+    with process_pool(max_workers=max_workers, shared={'x': x, 'y': y}) as pool:
+        futures = [pool.submit(_resample_batch, kind, s, n, method, block_length) for kind, s, n in tasks]
+        results = [future.result() for future in futures]
+    bootstrap = np.concatenate(results[:len(batches)], axis=1)
+    permuted = np.concatenate(results[len(batches):], axis=1)
+
+    alpha = (1 - confidence) / 2
+    with np.errstate(invalid='ignore'):
+        ci_low, ci_high = np.nanquantile(bootstrap, [alpha, 1 - alpha], axis=1)
+        extreme = (np.abs(permuted) >= np.abs(observed)[:, None] - 1e-12).sum(axis=1)
+    p_perm = (extreme + 1) / (np.isfinite(permuted).sum(axis=1) + 1)
+    p_perm[np.isnan(observed)] = np.nan
+    return pd.DataFrame({
+        'corr': observed, 'ci_low': ci_low, 'ci_high': ci_high, 'p_perm': p_perm,
+    }, index=groups)
@@ -0,0 +1,113 @@
+# Materialized count cubes for the crime and permit datasets.
+# One groupby pass produces the number of rows for every combination of the
+# cube dimensions; charts and correlations are then answered by rolling the cube
+# up to the dimensions they need instead of rescanning the rows. New data (e.g. a
+# month of NYC Open Data) is folded in by counting only the new rows.
+
+import os
+import pandas as pd
+from store import DATA_DIR, DATASETS, load_dataset
+
+CUBE_DIMENSIONS = {
+    'crime': ['BORO_NM', 'Year', 'Month', 'OFNS_DESC', 'LAW_CAT_CD', 'PREM_TYP_DESC'],
+    'urban': ['BOROUGH', 'Year', 'Month', 'Job Type', 'Permit Status', 'Residential'],
+}
+
+
+def cube_path(dataset):
+    return os.path.join(DATA_DIR, f'{dataset}_cube.parquet')
+
+
+class CountCube:
+    """
+    Row counts of `dataset` for every observed combination of its cube
+    dimensions, held as a Series with one MultiIndex level per dimension.
+    Missing values are kept as their own keys so nothing is lost on roll-up.
+    """
+
+    def __init__(self, dataset, counts=None):
+        self.dataset = dataset
+        self.dimensions = CUBE_DIMENSIONS[dataset]
+        if counts is None:
+            empty = pd.MultiIndex.from_arrays([[] for _ in self.dimensions], names=self.dimensions)
+            counts = pd.Series([], index=empty, dtype='int64')
+        self.counts = counts
+
+    @classmethod
+    def from_rows(cls, dataset, rows):
+        return cls(dataset).append(rows)
+
+    def _count(self, rows):
+        dates = pd.to_datetime(rows[DATASETS[self.dataset]['date_column']], errors='coerce')
+        keys = rows[[d for d in self.dimensions if d not in ('Year', 'Month')]].copy()
+        keys['Year'] = dates.dt.year.astype('Int16')
+        keys['Month'] = dates.dt.month.astype('Int8')
+        return keys[self.dimensions].groupby(self.dimensions, dropna=False, observed=True).size()
+
+    def append(self, rows):
+        """Fold new rows into the cube by counting only those rows."""
+        new_counts = self._count(rows)
+        if len(self.counts):
+            # Regroup rather than align: index alignment does not match missing keys reliably
+            new_counts = pd.concat([self.counts, new_counts]).groupby(
+                level=self.dimensions, dropna=False, observed=True).sum()
+        self.counts = new_counts.astype('int64')
+        return self
+
+    def rollup(self, dimensions, dropna=True, **filters):
+        """
+        Total counts over `dimensions` (a list of dimension names), optionally
+        restricted with filters such as Year=[2018, 2019]. Like groupby, keys
+        with missing values are dropped unless dropna=False.
+        """
+        counts = self.counts
+        for dimension, values in filters.items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            counts = counts[counts.index.get_level_values(dimension).isin(values)]
+        return counts.groupby(level=list(dimensions), dropna=dropna, observed=True).sum()
+
+    def monthly_matrix(self, group_dimension, start='2016-01', end='2019-12'):
+        """Group x month count matrix with one Period column per month, zero-filled."""
+        by_month = self.rollup([group_dimension, 'Year', 'Month']).reset_index(name='count')
+        by_month['Period'] = pd.PeriodIndex.from_fields(
+            year=by_month['Year'].astype('int64'), month=by_month['Month'].astype('int64'), freq='M'
+        )
+        matrix = by_month.pivot_table(index=group_dimension, columns='Period', values='count',
+                                      aggfunc='sum', fill_value=0, observed=True)
+        months = pd.period_range(start, end, freq='M')
+        return matrix.reindex(columns=months, fill_value=0).astype('int64')
+
+    def save(self, path=None):
+        self.counts.rename('count').reset_index().to_parquet(path or cube_path(self.dataset), index=False)
+
+    @classmethod
+    def load(cls, dataset, path=None):
+        frame = pd.read_parquet(path or cube_path(dataset))
+        dimensions = CUBE_DIMENSIONS[dataset]
+        frame['Year'] = frame['Year'].astype('Int16')
+        frame['Month'] = frame['Month'].astype('Int8')
+        return cls(dataset, frame.set_index(dimensions)['count'].astype('int64'))
+
+
+def build_cube(dataset, save=True):
+    """Count the full cleaned dataset into a new cube (and save it)."""
+    columns = [d for d in CUBE_DIMENSIONS[dataset] if d not in ('Year', 'Month')]
+    rows = load_dataset(dataset, columns=columns + [DATASETS[dataset]['date_column']])
+    cube = CountCube.from_rows(dataset, rows)
+    if save:
+        cube.save()
+    return cube
+
+
+def load_cube(dataset):
+    """The saved cube of `dataset`, built from the cleaned data the first time."""
+    if os.path.exists(cube_path(dataset)):
+        return CountCube.load(dataset)
+    return build_cube(dataset)
+
+
+def append_to_cube(dataset, rows):
+    """Add newly published rows (e.g. one month) to the saved cube without rescanning the history."""
+    cube = load_cube(dataset).append(rows)
+    cube.save()
+    return cube
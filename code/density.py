@@ -0,0 +1,131 @@
+# Kernel density hotspot surfaces.
+# Points are binned onto a fine metric grid (metres from the NYC projection in
+# spatial.py) and the cell counts are convolved with a Gaussian or quartic kernel
+# through FFTs. A surface then costs O(cells log cells) however many points there
+# are, instead of one kernel evaluation per point and cell. Each layer (e.g. a year
+# or a law category) is transformed once and reused for every bandwidth, and the
+# grid is zero-padded by the widest kernel so the circular convolution never wraps.
+
+import numpy as np
+import pandas as pd
+from scipy import fft
+from spatial import NYC_EXTENT, to_metres
+from profiling import profiled
+
+KERNELS = ('gaussian', 'quartic')
+
+
+def kernel_radius(bandwidth, kernel='gaussian'):
+    """Distance in metres beyond which the kernel is zero (a Gaussian is cut at 4 bandwidths)."""
+    return 4 * bandwidth if kernel == 'gaussian' else bandwidth
+
+
+def kernel_weights(bandwidth, cell_size, kernel='gaussian'):
+    """Kernel sampled at the cell centres around the origin, normalised to sum to 1."""
+    if kernel not in KERNELS:
+        raise ValueError(f"Unknown kernel '{kernel}'; choose from {', '.join(KERNELS)}")
+    r = int(np.ceil(kernel_radius(bandwidth, kernel) / cell_size))
+    offsets = np.arange(-r, r + 1) * cell_size
+    d2 = (offsets[:, None] ** 2 + offsets[None, :] ** 2) / bandwidth ** 2
+    if kernel == 'gaussian':
+        weights = np.exp(-0.5 * d2) * (d2 <= 16)
+    else:
+        weights = np.clip(1 - d2, 0, None) ** 2
+    if weights.sum() == 0:
+        # Bandwidth below the cell size: the kernel is the cell itself
+        weights[r, r] = 1
+    return (weights / weights.sum()).astype('float32')
+
+
+class DensityGrid:
+    """
+    Grid of `cell_size`-metre square cells covering `extent` (lon_min, lon_max,
+    lat_min, lat_max). Arrays are indexed [row, col] with row 0 at the south
+    edge, as drawn by imshow(origin='lower').
+    """
+
+    def __init__(self, extent=NYC_EXTENT, cell_size=10):
+        self.extent = extent
+        self.cell_size = cell_size
+        lon_min, lon_max, lat_min, lat_max = extent
+        (self.x_min, self.y_min), (x_max, y_max) = to_metres([lat_min, lat_max], [lon_min, lon_max])
+        self.n_cols = int(np.ceil((x_max - self.x_min) / cell_size))
+        self.n_rows = int(np.ceil((y_max - self.y_min) / cell_size))
+
+    @property
+    def shape(self):
+        return self.n_rows, self.n_cols
+
+    @profiled()
+    def bin(self, lon, lat, groups=None):
+        """
+        Point counts per cell as a float32 array of shape (n_layers, n_rows, n_cols),
+        and the layer labels. With `groups` (e.g. the year or LAW_CAT_CD of every
+        point) there is one layer per distinct value, otherwise a single 'all' layer.
+        Points outside the grid or without coordinates are ignored.
+        """
+        xy = to_metres(lat, lon)
+        col = np.floor((xy[:, 0] - self.x_min) / self.cell_size)
+        row = np.floor((xy[:, 1] - self.y_min) / self.cell_size)
+        inside = (col >= 0) & (col < self.n_cols) & (row >= 0) & (row < self.n_rows)
+        if groups is None:
+            layer, labels = np.zeros(len(xy), dtype='int64'), pd.Index(['all'])
+        else:
+            layer, labels = pd.factorize(pd.Series(groups), sort=True)
+            inside &= layer >= 0
+        cell = row[inside].astype('int64') * self.n_cols + col[inside].astype('int64')
+        layer = layer[inside]
+        # One layer at a time, so the int64 bincount never spans every layer of a fine grid
+        counts = np.empty((len(labels), self.n_rows * self.n_cols), dtype='float32')
+        for i in range(len(labels)):
+            counts[i] = np.bincount(cell[layer == i], minlength=counts.shape[1])
+        return counts.reshape(len(labels), self.n_rows, self.n_cols), pd.Index(labels)
+
+    def iter_surfaces(self, counts, bandwidths, kernel='gaussian', workers=-1):
+        """
+        Yield (layer, bandwidth, surface) for every layer of `counts` (from bin) and,
+        within a layer, every bandwidth in metres in the given order, one at a time
+        so only one surface is held. A
+        surface is the smoothed density in points per km².
+        """
+        counts = np.asarray(counts, dtype='float32').reshape(-1, *self.shape)
+        kernels = [kernel_weights(bandwidth, self.cell_size, kernel) for bandwidth in bandwidths]
+        pad = max(len(weights) for weights in kernels) // 2
+        shape = tuple(fft.next_fast_len(n + pad, real=True) for n in self.shape)
+        per_km2 = 1e6 / self.cell_size ** 2
+
+        # Kernels are centred on cell (0, 0) of the padded grid, wrapping to the far edges
+        kernel_spectra = []
+        for weights in kernels:
+            full = np.zeros(shape, dtype='float32')
+            full[:len(weights), :len(weights)] = weights
+            full = np.roll(full, (-(len(weights) // 2), -(len(weights) // 2)), axis=(0, 1))
+            kernel_spectra.append(fft.rfft2(full, workers=workers))
+
+        for layer in range(len(counts)):
+            spectrum = fft.rfft2(counts[layer], s=shape, workers=workers)
+            for bandwidth, kernel_spectrum in zip(bandwidths, kernel_spectra):
+                surface = fft.irfft2(spectrum * kernel_spectrum, s=shape, workers=workers)[:self.n_rows, :self.n_cols]
+                # FFT round-off leaves tiny negative values where there are no points
+                surface = np.maximum(surface, 0)
+                surface *= per_km2
+                yield layer, bandwidth, surface
+
+    @profiled()
+    def surfaces(self, counts, bandwidths, kernel='gaussian', workers=-1):
+        """All surfaces of iter_surfaces as one array of shape (n_layers, n_bandwidths, n_rows, n_cols)."""
+        counts = np.asarray(counts, dtype='float32').reshape(-1, *self.shape)
+        bandwidths = list(bandwidths)
+        result = np.zeros((len(counts), len(bandwidths), *self.shape), dtype='float32')
+        # Surfaces come layer by layer in bandwidth order, so a repeated bandwidth gets its own slot
+        for i, (layer, _, surface) in enumerate(self.iter_surfaces(counts, bandwidths, kernel, workers)):
+            result[layer, i % len(bandwidths)] = surface
+        return result
+
+
+def difference_surface(surface, other):
+    """
+    Difference between two surfaces normalised to sum to 1 (e.g. crimes minus
+    permits): positive where the first is more concentrated than the second.
+    """
+    return surface / max(surface.sum(), 1e-12) - other / max(other.sum(), 1e-12)
@@ -0,0 +1,94 @@
+# Headless batch export of the analysis figures.
+# Each chart of a script is a function registered with @figure(name) and drawn by
+# render_figures(). Interactively the charts are shown one after another, as they
+# always were. With FIGURES_DIR set they are drawn on the non-interactive Agg
+# backend instead, concurrently in a process pool (forked workers inherit the
+# script's data), saved in every FIGURE_FORMATS format (PNG and SVG by default) to
+# FIGURES_DIR, and the time and memory each figure took are reported.
+#
+# Usage: FIGURES_DIR=../figures python graphs.py
+
+import os
+import sys
+import time
+import matplotlib
+import pandas as pd
+from parallel import process_pool
+from profiling import measure
+
+FIGURES_DIR = os.environ.get('FIGURES_DIR')
+FIGURE_FORMATS = os.environ.get('FIGURE_FORMATS', 'png,svg').split(',')
+FIGURE_DPI = 150
+
+if FIGURES_DIR:
+    matplotlib.use('Agg', force=True)
+
+import matplotlib.pyplot as plt  # noqa: E402  (after the backend is chosen)
+
+_figures = {}
+
+
+def figure(name):
+    """Register the decorated function, which draws one chart with pyplot, as the figure `name`."""
+    def register(func):
+        _figures[name] = func
+        return func
+    return register
+
+
+def _render(name):
+    plt.close('all')
+    _, draw = measure(_figures[name])
+    if not plt.get_fignums():
+        # Nothing to draw, e.g. a dimension missing from the data
+        return None
+    fig = plt.gcf()
+
+    def save():
+        paths = [os.path.join(FIGURES_DIR, f'{name}.{fmt}') for fmt in FIGURE_FORMATS]
+        for path in paths:
+            fig.savefig(path, dpi=FIGURE_DPI, bbox_inches='tight')
+        return paths
+
+    paths, saved = measure(save)
+    plt.close('all')
+    return {
+        'figure': name,
+        'draw_s': draw['wall_s'],
+        'save_s': saved['wall_s'],
+        'cpu_s': draw['cpu_s'] + saved['cpu_s'],
+        'peak_rss_mb': max(draw['peak_rss_mb'], saved['peak_rss_mb']),
+        'size_kb': sum(os.path.getsize(path) for path in paths) / 2 ** 10,
+    }
+
+
+def render_figures(names=None, max_workers=None):
+    """
+    Draw the registered figures (all by default). Without FIGURES_DIR each one is
+    shown in turn; with it they are exported in parallel and a frame of the
+    per-figure costs (build and save seconds, CPU seconds, peak memory and file
+    size) is printed, written to FIGURES_DIR and returned.
+    """
+    names = list(names or _figures)
+    if not FIGURES_DIR:
+        for name in names:
+            _figures[name]()
+            plt.show()
+        return None
+
+    columns = ['figure', 'draw_s', 'save_s', 'cpu_s', 'peak_rss_mb', 'size_kb']
+    if not names:
+        return pd.DataFrame(columns=columns)
+
+    os.makedirs(FIGURES_DIR, exist_ok=True)
+    start = time.perf_counter()
+    with process_pool(max_workers=min(max_workers or os.cpu_count(), len(names))) as pool:
+        costs = [cost for cost in pool.map(_render, names) if cost]
+    elapsed = time.perf_counter() - start
+
+    costs = pd.DataFrame(costs, columns=columns)
+    script = os.path.splitext(os.path.basename(sys.argv[0] or 'figures'))[0]
+    costs.to_csv(os.path.join(FIGURES_DIR, f'{script}_render_costs.csv'), index=False)
+    print(f"\nExported {len(costs)} figures to '{os.path.normpath(FIGURES_DIR)}' in {elapsed:.2f}s:")
+    print(costs.set_index('figure').round(3).to_string())
+    return costs
@@ -1,20 +1,39 @@
-import pandas as pd
 import matplotlib.pyplot as plt
+import numpy as np
 import seaborn as sns
+from matplotlib.colors import PowerNorm
+from matplotlib.patches import Patch
+from store import load_dataset
+from render import RasterCanvas
+from density import DensityGrid, difference_surface
+from cube import load_cube
+from profiling import step
+from figures import figure, render_figures
 
-# Load datasets
-crime_df = pd.read_csv("../code/sampled_crime_data.csv")
-urban_df = pd.read_csv("../code/filtered_urban_data.csv")
+# Draw point maps as a binned raster instead of one scatter marker per point
+RASTER_MAPS = True
 
-# Convert 'CMPLNT_FR_DT' to datetime
-crime_df['CMPLNT_FR_DT'] = pd.to_datetime(crime_df['CMPLNT_FR_DT'], errors='coerce')
+# Kernel density hotspot surfaces (see density.py): cell size and bandwidths in metres.
+# At 50 m the city grid is about 960 x 960 cells and a figure peaks at a few tens of MB;
+# memory and time grow with the square of the resolution (10 m: ~1-1.5 GB per figure)
+KDE_CELL_SIZE = 50
+KDE_BANDWIDTHS = (250, 500, 1000)
+KDE_KERNEL = 'quartic'
 
-# Extract year from the complaint date
-crime_df['Year'] = crime_df['CMPLNT_FR_DT'].dt.year
+# Graphs 1-5 are roll-ups of the materialized count cubes (see cube.py);
+# only the point maps need the rows themselves
+step("Load count cubes and points")
+crime_cube = load_cube('crime')
+urban_cube = load_cube('urban')
+crime_df = load_dataset('crime', columns=['Latitude', 'Longitude', 'CMPLNT_FR_DT', 'LAW_CAT_CD'])
+urban_df = load_dataset('urban', columns=['LATITUDE', 'LONGITUDE'])
 
 # Graph 1: Number of crimes per borough per year
-if 'BORO_NM' in crime_df.columns and 'Year' in crime_df.columns:
-    crimes_per_borough_year = crime_df.groupby(['BORO_NM', 'Year']).size().reset_index(name='Crime Count')
+@figure('crimes_per_borough_year')
+def plot_crimes_per_borough_year():
+    if not ('BORO_NM' in crime_cube.dimensions and 'Year' in crime_cube.dimensions):
+        return
+    crimes_per_borough_year = crime_cube.rollup(['BORO_NM', 'Year']).reset_index(name='Crime Count')
     crimes_pivot = crimes_per_borough_year.pivot(index='Year', columns='BORO_NM', values='Crime Count')
 
     crimes_pivot.plot(kind='bar', stacked=True, figsize=(12, 8))
@@ -24,11 +43,14 @@ if 'BORO_NM' in crime_df.columns and 'Year' in crime_df.columns:
     plt.xticks(rotation=45)
     plt.legend(title='Borough', bbox_to_anchor=(1.05, 1), loc='upper left')
     plt.tight_layout()
-    plt.show()
+
 
 # Graph 2: Severity of crimes per year
-if 'LAW_CAT_CD' in crime_df.columns and 'Year' in crime_df.columns:
-    severity_per_year = crime_df.groupby(['Year', 'LAW_CAT_CD']).size().reset_index(name='Crime Count')
+@figure('crime_severity_per_year')
+def plot_crime_severity_per_year():
+    if not ('LAW_CAT_CD' in crime_cube.dimensions and 'Year' in crime_cube.dimensions):
+        return
+    severity_per_year = crime_cube.rollup(['Year', 'LAW_CAT_CD']).reset_index(name='Crime Count')
     severity_pivot = severity_per_year.pivot(index='Year', columns='LAW_CAT_CD', values='Crime Count')
 
     plt.figure(figsize=(10, 6))
@@ -37,23 +59,28 @@ if 'LAW_CAT_CD' in crime_df.columns and 'Year' in crime_df.columns:
     plt.xlabel('Severity')
     plt.ylabel('Year')
     plt.tight_layout()
-    plt.show()
+
 
 # Graph 3: Top 10 types of crime locations
-if 'PREM_TYP_DESC' in crime_df.columns:
-    top_premises = crime_df['PREM_TYP_DESC'].value_counts().head(10)
+@figure('top_crime_locations')
+def plot_top_crime_locations():
+    if 'PREM_TYP_DESC' not in crime_cube.dimensions:
+        return
+    top_premises = crime_cube.rollup(['PREM_TYP_DESC']).sort_values(ascending=False).head(10)
     plt.figure(figsize=(10, 6))
     sns.barplot(x=top_premises.values, y=top_premises.index, palette='Reds_r')
     plt.xlabel('Count')
     plt.ylabel('Premises Type')
     plt.title('Top 10 Crime Locations')
     plt.tight_layout()
-    plt.show()
+
 
 # Graph 4: Number of permits filed per borough per year
-if 'Filing Date' in urban_df.columns and 'BOROUGH' in urban_df.columns:
-    urban_df['Year'] = pd.to_datetime(urban_df['Filing Date'], errors='coerce').dt.year
-    permits_by_year_borough = urban_df.groupby(['Year', 'BOROUGH']).size().unstack(fill_value=0)
+@figure('permits_per_borough_year')
+def plot_permits_per_borough_year():
+    if not ('Year' in urban_cube.dimensions and 'BOROUGH' in urban_cube.dimensions):
+        return
+    permits_by_year_borough = urban_cube.rollup(['Year', 'BOROUGH']).unstack(fill_value=0)
 
     permits_by_year_borough.plot(kind='bar', stacked=False, figsize=(12, 8))
     plt.title('Permits Per Year by Borough')
@@ -61,14 +88,16 @@ if 'Filing Date' in urban_df.columns and 'BOROUGH' in urban_df.columns:
     plt.ylabel('Number of Permits')
     plt.legend(title='Borough', bbox_to_anchor=(1.05, 1), loc='upper left')
     plt.tight_layout()
-    plt.show()
+
 
 # Graph 5: Top 5 crimes filed per borough per year
-if 'CMPLNT_FR_DT' in crime_df.columns and 'BORO_NM' in crime_df.columns and 'OFNS_DESC' in crime_df.columns:
-    top_offenses = crime_df['OFNS_DESC'].value_counts().head(5).index
-    crime_df['Year'] = pd.to_datetime(crime_df['CMPLNT_FR_DT'], errors='coerce').dt.year
-    offenses_per_year_borough = crime_df.groupby(['Year', 'BORO_NM', 'OFNS_DESC']).size().reset_index(name='Count')
-    offenses_pivot = offenses_per_year_borough.pivot_table(index=['Year', 'BORO_NM'], columns='OFNS_DESC', values='Count', fill_value=0)
+@figure('top_offenses_per_year')
+def plot_top_offenses_per_year():
+    if not ('Year' in crime_cube.dimensions and 'BORO_NM' in crime_cube.dimensions and 'OFNS_DESC' in crime_cube.dimensions):
+        return
+    top_offenses = crime_cube.rollup(['OFNS_DESC']).sort_values(ascending=False).head(5).index
+    offenses_per_year_borough = crime_cube.rollup(['Year', 'BORO_NM', 'OFNS_DESC']).reset_index(name='Count')
+    offenses_pivot = offenses_per_year_borough.pivot_table(index=['Year', 'BORO_NM'], columns='OFNS_DESC', values='Count', fill_value=0, observed=True)
     offenses_pivot_top = offenses_pivot[top_offenses]
 
     offenses_pivot_top.groupby('Year').sum().plot(kind='bar', figsize=(15, 8))
@@ -77,16 +106,91 @@ if 'CMPLNT_FR_DT' in crime_df.columns and 'BORO_NM' in crime_df.columns and 'OFN
     plt.ylabel('Count of Offenses')
     plt.legend(title='Offense Description', bbox_to_anchor=(1.05, 1), loc='upper left')
     plt.tight_layout()
-    plt.show()
+
 
 # Graph 6: Distribution of urban development vs crime
-plt.figure(figsize=(12, 8))
-plt.scatter(crime_df['Longitude'], crime_df['Latitude'], c='red', s=10, alpha=0.5, label='All Crime Locations')
-plt.scatter(urban_df['LONGITUDE'], urban_df['LATITUDE'], c='blue', s=10, alpha=0.5, label='All Urban Development Locations')
-plt.xlabel('Longitude')
-plt.ylabel('Latitude')
-plt.title('Comparison of Crime and Urban Development Locations')
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.show()
+@figure('crime_vs_urban_locations')
+def plot_crime_vs_urban_locations():
+    plt.figure(figsize=(12, 8))
+    if RASTER_MAPS:
+        # Bin both datasets into one pixel grid and draw it as a single image layer
+        canvas = RasterCanvas(n_labels=2)
+        canvas.add(crime_df['Longitude'], crime_df['Latitude'], labels=np.zeros(len(crime_df)))
+        canvas.add(urban_df['LONGITUDE'], urban_df['LATITUDE'], labels=np.ones(len(urban_df)))
+        canvas.draw(plt.gca(), canvas.shade_labels(['red', 'blue']))
+        plt.legend(handles=[Patch(color='red', label='All Crime Locations'),
+                            Patch(color='blue', label='All Urban Development Locations')])
+    else:
+        plt.scatter(crime_df['Longitude'], crime_df['Latitude'], c='red', s=10, alpha=0.5, label='All Crime Locations')
+        plt.scatter(urban_df['LONGITUDE'], urban_df['LATITUDE'], c='blue', s=10, alpha=0.5, label='All Urban Development Locations')
+        plt.legend()
+    plt.xlabel('Longitude')
+    plt.ylabel('Latitude')
+    plt.title('Comparison of Crime and Urban Development Locations')
+    plt.grid(True)
+    plt.tight_layout()
+
+
+
+# Graphs 7-9: Kernel density hotspot surfaces
+# Surfaces are computed at KDE_CELL_SIZE and drawn at about the resolution of a panel;
+# with bandwidths of many cells, skipping cells for display loses nothing visible
+kde_grid = DensityGrid(cell_size=KDE_CELL_SIZE)
+kde_stride = max(kde_grid.n_cols // 1200, 1)
+
+
+def density_surfaces(counts, bandwidths):
+    """Display-resolution surfaces of every layer and bandwidth, shape (n_layers, n_bandwidths, rows, cols)."""
+    surfaces = [surface[::kde_stride, ::kde_stride]
+                for _, _, surface in kde_grid.iter_surfaces(counts, bandwidths, kernel=KDE_KERNEL)]
+    return np.stack(surfaces).reshape(len(counts), len(bandwidths), *surfaces[0].shape)
+
+
+def plot_density_panels(counts, labels, bandwidth, title):
+    """One density surface per layer of `counts`, side by side on a shared colour scale."""
+    fig, axes = plt.subplots(1, len(labels), figsize=(6 * len(labels), 6), sharex=True, sharey=True, squeeze=False)
+    surfaces = density_surfaces(counts, [bandwidth])[:, 0]
+    norm = PowerNorm(gamma=0.5, vmin=0, vmax=max(surfaces.max(), 1e-9))
+    for ax, label, surface in zip(axes[0], labels, surfaces):
+        image = ax.imshow(surface, extent=kde_grid.extent, origin='lower', cmap='magma', norm=norm, aspect='auto')
+        ax.set_title(str(label))
+        ax.set_xlabel('Longitude')
+    axes[0][0].set_ylabel('Latitude')
+    fig.colorbar(image, ax=axes[0].tolist(), label='Points per km²')
+    fig.suptitle(f'{title} ({KDE_KERNEL} kernel, {bandwidth} m bandwidth)')
+
+
+@figure('crime_density_by_year')
+def plot_crime_density_by_year():
+    counts, years = kde_grid.bin(crime_df['Longitude'], crime_df['Latitude'], groups=crime_df['CMPLNT_FR_DT'].dt.year)
+    plot_density_panels(counts, years, KDE_BANDWIDTHS[1], 'Crime Density by Year')
+
+
+@figure('crime_density_by_law_category')
+def plot_crime_density_by_law_category():
+    counts, categories = kde_grid.bin(crime_df['Longitude'], crime_df['Latitude'], groups=crime_df['LAW_CAT_CD'])
+    plot_density_panels(counts, categories, KDE_BANDWIDTHS[1], 'Crime Density by Law Category')
+
+
+@figure('crime_minus_permit_density')
+def plot_crime_minus_permit_density():
+    crime_counts, _ = kde_grid.bin(crime_df['Longitude'], crime_df['Latitude'])
+    urban_counts, _ = kde_grid.bin(urban_df['LONGITUDE'], urban_df['LATITUDE'])
+    # Every bandwidth in one batch: one FFT per dataset, one product per bandwidth
+    crime_surfaces, urban_surfaces = density_surfaces(np.concatenate([crime_counts, urban_counts]), KDE_BANDWIDTHS)
+    fig, axes = plt.subplots(1, len(KDE_BANDWIDTHS), figsize=(6 * len(KDE_BANDWIDTHS), 6), sharex=True, sharey=True,
+                             squeeze=False)
+    for ax, bandwidth, crime_surface, urban_surface in zip(axes[0], KDE_BANDWIDTHS, crime_surfaces, urban_surfaces):
+        difference = difference_surface(crime_surface, urban_surface)
+        limit = max(np.abs(difference).max(), 1e-12)
+        image = ax.imshow(difference, extent=kde_grid.extent, origin='lower', cmap='RdBu_r', vmin=-limit, vmax=limit,
+                          aspect='auto')
+        ax.set_title(f'{bandwidth} m bandwidth')
+        ax.set_xlabel('Longitude')
+        fig.colorbar(image, ax=ax, shrink=0.8, label='Crime share - permit share')
+    axes[0][0].set_ylabel('Latitude')
+    fig.suptitle(f'Crime minus Urban Development Density ({KDE_KERNEL} kernel; red: more crime than development)')
+
+
+step("Render figures")
+render_figures()
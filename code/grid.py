@@ -0,0 +1,99 @@
+# Regular lon/lat grid for spatial aggregation.
+# Points are assigned to cells by floor division and counted with bincount, so
+# building and filling the grid never creates per-cell geometries. Each point
+# lands in exactly one cell (cells are half-open), and a GeoDataFrame of cell
+# polygons is only built when a map actually needs one.
+
+import numpy as np
+import pandas as pd
+
+
+class Grid:
+    """
+    Grid of `resolution`-degree cells whose lower-left corner is (lon_min, lat_min).
+    Cells are numbered row by row: cell = row * n_cols + col.
+    """
+
+    def __init__(self, lon_min, lat_min, lon_max, lat_max, resolution=0.01):
+        self.lon_min = lon_min
+        self.lat_min = lat_min
+        self.resolution = resolution
+        self.n_cols = max(int(np.ceil((lon_max - lon_min) / resolution)), 1)
+        self.n_rows = max(int(np.ceil((lat_max - lat_min) / resolution)), 1)
+        self.n_cells = self.n_rows * self.n_cols
+
+    @classmethod
+    def from_points(cls, lon, lat, resolution=0.01):
+        """Grid covering the bounds of the given points."""
+        lon = np.asarray(lon, dtype='float64')
+        lat = np.asarray(lat, dtype='float64')
+        return cls(np.nanmin(lon), np.nanmin(lat), np.nanmax(lon), np.nanmax(lat), resolution)
+
+    def cell_index(self, lon, lat):
+        """Cell of every point, or -1 for points outside the grid or without coordinates."""
+        lon = np.asarray(lon, dtype='float64')
+        lat = np.asarray(lat, dtype='float64')
+        col = np.floor((lon - self.lon_min) / self.resolution)
+        row = np.floor((lat - self.lat_min) / self.resolution)
+        # Points on the far edge of the grid belong to the last cell
+        col = np.where(col == self.n_cols, self.n_cols - 1, col)
+        row = np.where(row == self.n_rows, self.n_rows - 1, row)
+        inside = (col >= 0) & (col < self.n_cols) & (row >= 0) & (row < self.n_rows)
+        cell = np.full(len(lon), -1, dtype='int64')
+        cell[inside] = row[inside].astype('int64') * self.n_cols + col[inside].astype('int64')
+        return cell
+
+    def count(self, lon, lat, time_bin=None, n_time_bins=None):
+        """
+        Number of points per cell, shape (n_cells,). With `time_bin` (an integer
+        bin per point, e.g. months since the start) the counts are per time bin
+        and cell, shape (n_time_bins, n_cells); without `n_time_bins` there are as
+        many bins as needed by the points in the grid, none if there are no such points.
+        """
+        cell = self.cell_index(lon, lat)
+        if time_bin is None:
+            return np.bincount(cell[cell >= 0], minlength=self.n_cells)
+
+        time_bin = np.asarray(time_bin)
+        if n_time_bins is None:
+            valid = (cell >= 0) & (time_bin >= 0)
+            n_time_bins = int(time_bin[valid].max()) + 1 if valid.any() else 0
+        keep = (cell >= 0) & (time_bin >= 0) & (time_bin < n_time_bins)
+        flat = time_bin[keep].astype('int64') * self.n_cells + cell[keep]
+        return np.bincount(flat, minlength=n_time_bins * self.n_cells).reshape(n_time_bins, self.n_cells)
+
+    def count_layers(self, layers, n_time_bins=None):
+        """
+        Convenience loop calling `count` for every point layer. `layers` maps a name
+        to (lon, lat) or (lon, lat, time_bin); returns a dict of name -> counts.
+        """
+        return {name: self.count(*points, n_time_bins=n_time_bins) for name, points in layers.items()}
+
+    def cells(self):
+        """Row, column and lower-left/centre coordinates of every cell."""
+        cell = np.arange(self.n_cells)
+        row, col = np.divmod(cell, self.n_cols)
+        x = self.lon_min + col * self.resolution
+        y = self.lat_min + row * self.resolution
+        return pd.DataFrame({
+            'row': row, 'col': col,
+            'x': x, 'y': y,
+            'x_center': x + self.resolution / 2, 'y_center': y + self.resolution / 2,
+        }, index=pd.Index(cell, name='cell'))
+
+    def to_frame(self, counts):
+        """Per-cell table with the cell coordinates and one column per (n_cells,) count layer."""
+        frame = self.cells()
+        for name, values in counts.items():
+            frame[name] = values
+        return frame
+
+    def to_geodataframe(self, frame=None):
+        """GeoDataFrame of cell polygons (EPSG:4326), for maps only."""
+        import geopandas as gpd
+        import shapely
+
+        frame = self.cells() if frame is None else frame
+        geometry = shapely.box(frame['x'], frame['y'],
+                               frame['x'] + self.resolution, frame['y'] + self.resolution)
+        return gpd.GeoDataFrame(frame, geometry=geometry, crs="EPSG:4326")
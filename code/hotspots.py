@@ -0,0 +1,155 @@
+# Emerging hotspot analysis on a space-time cube (grid cell x month).
+# Getis-Ord Gi* is computed for every bin of the cube at once: the space-time
+# neighbourhood of a bin (the cell and its queen neighbours, in the same and the
+# adjacent time steps) is a sparse spatial sum over the whole (time, cell) matrix
+# followed by a running sum along time. Each cell's Gi* series then gets a
+# Mann-Kendall trend test, vectorized over the cells, and the significant hot/cold
+# bins and the trend are combined into the emerging hotspot categories (new,
+# consecutive, intensifying, persistent, diminishing, sporadic, oscillating,
+# historical).
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.stats import norm
+from autocorrelation import queen_adjacency
+from profiling import profiled
+
+PATTERNS = ['New', 'Consecutive', 'Intensifying', 'Persistent', 'Diminishing', 'Sporadic', 'Oscillating',
+            'Historical']
+NO_PATTERN = 'No Pattern Detected'
+
+
+def space_time_cube(grid, lon, lat, dates, start='2016-01', end='2019-12'):
+    """
+    (n_months, n_cells) counts of points per cell of `grid` (a grid.Grid) and
+    month from `start` to `end`, and the months as a PeriodIndex.
+    """
+    months = pd.period_range(start, end, freq='M')
+    dates = pd.to_datetime(pd.Series(dates))
+    month_index = ((dates.dt.year - months[0].year) * 12 + (dates.dt.month - months[0].month)).to_numpy()
+    month_index = np.where(np.isnan(month_index), -1, month_index).astype('int64')
+    return grid.count(lon, lat, time_bin=month_index, n_time_bins=len(months)), months
+
+
+def neighbourhood_sum(values, adjacency, time_window=1):
+    """
+    Sum of `values` (n_times, n_cells) over every bin's space-time neighbourhood:
+    the cell and its `adjacency` neighbours, within `time_window` steps either side.
+    """
+    spatial = np.asarray((adjacency @ values.T).T) + values
+    # Running sum along time: steps t - time_window .. t + time_window
+    cumulative = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(spatial, axis=0)])
+    n_times = values.shape[0]
+    upper = np.minimum(np.arange(n_times) + time_window + 1, n_times)
+    lower = np.maximum(np.arange(n_times) - time_window, 0)
+    return cumulative[upper] - cumulative[lower]
+
+
+@profiled()
+def gi_star(counts, adjacency, time_window=1):
+    """
+    Getis-Ord Gi* z-score of every bin of a (n_times, n_cells) cube with binary
+    space-time weights (see neighbourhood_sum). Positive z-scores are clusters of
+    high values, negative ones clusters of low values.
+    """
+    x = np.asarray(counts, dtype='float64')
+    adjacency = sparse.csr_matrix(adjacency, dtype='float64')
+    n = x.size
+    mean = x.mean()
+    std = np.sqrt((x ** 2).mean() - mean ** 2)
+    local_sum = neighbourhood_sum(x, adjacency, time_window)
+    # With binary weights the sum of weights and of squared weights are both the neighbourhood size
+    n_neighbours = neighbourhood_sum(np.ones_like(x), adjacency, time_window)
+    denominator = std * np.sqrt((n * n_neighbours - n_neighbours ** 2) / (n - 1))
+    return np.divide(local_sum - mean * n_neighbours, denominator, out=np.zeros_like(x), where=denominator > 0)
+
+
+@profiled()
+def mann_kendall(series):
+    """
+    Mann-Kendall trend test of every column of a (n_times, n_series) array.
+    Returns the z-scores (positive for increasing trends) and two-sided p-values,
+    with the variance corrected for ties.
+    """
+    x = np.asarray(series, dtype='float64')
+    n_times, n_series = x.shape
+    s = np.zeros(n_series)
+    for i in range(n_times - 1):
+        s += np.sign(x[i + 1:] - x[i]).sum(axis=0)
+
+    # Tie groups: runs of equal values in each sorted series
+    ordered = np.sort(x, axis=0)
+    starts = np.vstack([np.ones((1, n_series), dtype=bool), np.diff(ordered, axis=0) != 0])
+    group = np.cumsum(starts, axis=0) - 1 + np.arange(n_series) * n_times
+    t = np.bincount(group.ravel(), minlength=n_times * n_series).astype('float64')
+    ties = np.bincount(np.repeat(np.arange(n_series), n_times), weights=t * (t - 1) * (2 * t + 5), minlength=n_series)
+
+    variance = (n_times * (n_times - 1) * (2 * n_times + 5) - ties) / 18
+    z = np.divide(s - np.sign(s), np.sqrt(variance), out=np.zeros(n_series), where=variance > 0)
+    return z, 2 * norm.sf(np.abs(z))
+
+
+def _patterns(significant, opposite, trend_z, trend_p, alpha):
+    """Pattern index of every cell from its significant bins of one sign and of the opposite sign, or -1."""
+    n_times = len(significant)
+    final = significant[-1]
+    n_significant = significant.sum(axis=0)
+    mostly = n_significant >= 0.9 * n_times
+    # Length of the trailing run of significant bins
+    missed = ~significant[::-1]
+    trailing = np.where(missed.any(axis=0), np.argmax(missed, axis=0), n_times)
+    trending = trend_p < alpha
+    conditions = [
+        final & (n_significant == 1),
+        final & (trailing >= 2) & (n_significant == trailing) & ~mostly,
+        final & mostly & trending & (trend_z > 0),
+        final & mostly & ~trending,
+        final & mostly & trending & (trend_z < 0),
+        final & ~mostly & ~opposite.any(axis=0),
+        final & ~mostly & opposite.any(axis=0),
+        ~final & mostly,
+    ]
+    return np.select(conditions, list(range(len(PATTERNS))), default=-1)
+
+
+@profiled()
+def emerging_hotspots(counts, n_rows, n_cols, time_window=1, alpha=0.05, active_only=True):
+    """
+    Emerging hotspot analysis of a (n_times, n_rows * n_cols) cube from
+    space_time_cube. With `active_only` only cells with at least one point over
+    the whole period take part (cells in water or parks never do). Returns the
+    Gi* z-scores (n_times, n_cells; NaN for inactive cells) and a per-cell frame
+    with the number of hot and cold bins, the Mann-Kendall trend of the Gi*
+    series and the category, e.g. 'Intensifying Hot Spot' or 'Diminishing Cold Spot'.
+    """
+    counts = np.asarray(counts)
+    active = counts.sum(axis=0) > 0 if active_only else np.ones(counts.shape[1], dtype=bool)
+    cells = np.flatnonzero(active)
+    adjacency = queen_adjacency(n_rows, n_cols)[cells][:, cells]
+
+    z = gi_star(counts[:, cells], adjacency, time_window)
+    p = 2 * norm.sf(np.abs(z))
+    hot = (z > 0) & (p < alpha)
+    cold = (z < 0) & (p < alpha)
+    trend_z, trend_p = mann_kendall(z)
+
+    hot_pattern = _patterns(hot, cold, trend_z, trend_p, alpha)
+    # Cold patterns mirror the hot ones, with a falling Gi* as the "intensifying" direction
+    cold_pattern = _patterns(cold, hot, -trend_z, trend_p, alpha)
+    labels = np.array([f'{pattern} Hot Spot' for pattern in PATTERNS] + [f'{pattern} Cold Spot' for pattern in PATTERNS]
+                      + [NO_PATTERN])
+    category = np.where(hot_pattern >= 0, hot_pattern,
+                        np.where(cold_pattern >= 0, cold_pattern + len(PATTERNS), len(labels) - 1))
+
+    gi = np.full(counts.shape, np.nan)
+    gi[:, cells] = z
+    result = pd.DataFrame({
+        'count': counts[:, cells].sum(axis=0),
+        'hot_bins': hot.sum(axis=0),
+        'cold_bins': cold.sum(axis=0),
+        'trend_z': trend_z,
+        'trend_p': trend_p,
+        'category': pd.Categorical(labels[category], categories=labels),
+    }, index=pd.Index(cells, name='cell'))
+    return gi, result
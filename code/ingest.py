@@ -0,0 +1,127 @@
+# Chunked ingest of the raw complaint (Book1) and permit (Book2) CSVs.
+# The full NYPD complaint history does not fit comfortably in memory, so the raw
+# files are read in bounded-size chunks and only the rows and columns that are
+# needed are ever kept. Peak memory is set by the chunk size, not the file size.
+
+import numpy as np
+import pandas as pd
+from profiling import profiled
+
+
+def iter_chunks(file_path, columns, window_column, start, end, date_columns=None,
+                chunksize=500000, date_format=None):
+    """
+    Yield chunks of a CSV restricted to `columns` and to rows whose
+    `window_column` date falls between `start` and `end` (inclusive).
+    Date columns are parsed per chunk, so no full-file datetime pass is needed.
+    """
+    date_columns = date_columns or [window_column]
+    reader = pd.read_csv(file_path, usecols=columns, chunksize=chunksize, low_memory=False)
+    for chunk in reader:
+        for col in date_columns:
+            chunk[col] = pd.to_datetime(chunk[col], errors='coerce', format=date_format)
+        in_window = (chunk[window_column] >= start) & (chunk[window_column] <= end)
+        yield chunk.loc[in_window, columns]
+
+
+class ReservoirSampler:
+    """
+    Reproducible sample of `n` rows from a stream of DataFrame chunks.
+
+    Every row gets a uniform random key from a seeded generator and the sample is
+    the `n` rows with the smallest keys, which is a uniform sample without
+    replacement. Only those rows are kept between chunks.
+
+    With `strata` (column names, or callables mapping a chunk to a Series) the
+    sample is allocated to each stratum in proportion to the number of rows it has
+    in the stream, and the smallest keys are kept per stratum. The quotas must be
+    known before sampling, so the stream is first passed to `count` and then to
+    `update`; the reservoir then never holds more than `n` rows.
+    """
+
+    def __init__(self, n, strata=None, seed=42):
+        self.n = n
+        self.strata = list(strata or [])
+        self.rng = np.random.default_rng(seed)
+        self.reservoir = None
+        self.rows_seen = 0
+        self.stratum_counts = None
+        self._quota = None
+
+    def _stratum_columns(self):
+        return [f'_stratum_{i}' for i in range(len(self.strata))]
+
+    def _stratum_values(self, chunk):
+        return {col: stratum(chunk) if callable(stratum) else chunk[stratum]
+                for col, stratum in zip(self._stratum_columns(), self.strata)}
+
+    def count(self, chunk):
+        """Count the rows of every stratum in a chunk, in the first pass over a stratified stream."""
+        if len(chunk) == 0 or not self.strata:
+            return
+        keys = [values.rename(col) for col, values in self._stratum_values(chunk).items()]
+        counts = chunk.groupby(keys, dropna=False).size()
+        if self.stratum_counts is None:
+            self.stratum_counts = counts
+        else:
+            self.stratum_counts = self.stratum_counts.add(counts, fill_value=0).astype('int64')
+        self.rows_seen += len(chunk)
+        self._quota = None
+
+    def quota(self):
+        """Rows to sample per stratum: proportional allocation with largest remainders so the quotas add up to n."""
+        if self._quota is None:
+            total = min(self.n, self.rows_seen)
+            share = self.stratum_counts / self.stratum_counts.sum() * total
+            quota = np.floor(share).astype('int64')
+            shortfall = int(total - quota.sum())
+            if shortfall > 0:
+                remainder = (share - quota).sort_values(ascending=False, kind='stable')
+                quota[remainder.index[:shortfall]] += 1
+            self._quota = quota.rename('_quota').reset_index()
+        return self._quota
+
+    def update(self, chunk):
+        """Offer a chunk of rows to the reservoir (the second pass over a stratified stream)."""
+        if len(chunk) == 0:
+            return
+        if self.strata and self.stratum_counts is None:
+            raise ValueError("A stratified stream must be counted with count() before it is sampled")
+        chunk = chunk.assign(_key=self.rng.random(len(chunk)), **self._stratum_values(chunk))
+        if not self.strata:
+            self.rows_seen += len(chunk)
+
+        pool = chunk if self.reservoir is None else pd.concat([self.reservoir, chunk], ignore_index=True)
+        pool = pool.sort_values('_key', kind='stable')
+        if self.strata:
+            # Keep each stratum's quota of smallest keys, at most n rows in all
+            rank = pool.groupby(self._stratum_columns(), dropna=False).cumcount().to_numpy()
+            quota = pool[self._stratum_columns()].merge(self.quota(), on=self._stratum_columns(), how='left')['_quota']
+            self.reservoir = pool[rank < quota.fillna(0).to_numpy()]
+        else:
+            self.reservoir = pool.head(self.n)
+
+    def sample(self):
+        """Return the current sample without the helper key columns."""
+        if self.reservoir is None:
+            return pd.DataFrame()
+        return self.reservoir.drop(columns=['_key'] + self._stratum_columns()).reset_index(drop=True)
+
+
+@profiled()
+def stream_sample(chunks, n, strata=None, seed=42):
+    """
+    Draw a reproducible `n`-row sample from chunks, holding at most `n` rows plus
+    one chunk. `chunks` is an iterable of chunks, or a callable returning a fresh
+    one; with `strata` it must be a callable, as the stream is read twice: once to
+    count the rows per stratum, then to sample with the final quotas.
+    """
+    sampler = ReservoirSampler(n, strata=strata, seed=seed)
+    if strata:
+        if not callable(chunks):
+            raise TypeError("A stratified sample reads the chunks twice; pass a callable returning them")
+        for chunk in chunks():
+            sampler.count(chunk)
+    for chunk in (chunks() if callable(chunks) else chunks):
+        sampler.update(chunk)
+    return sampler.sample()
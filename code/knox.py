@@ -0,0 +1,194 @@
+# Knox space-time interaction test for offense co-occurrence.
+# Two complaints interact when they are within `distance` metres and `window` days
+# of each other. Close pairs are found with KD-trees over time buckets one window
+# wide (a pair can only span the same or adjacent buckets), so all pairs are never
+# enumerated, and they are counted per offense pair. Significance comes from
+# Monte Carlo permutations of the dates over the complaints, run across a process pool.
+# Permuting the dates does not move the complaints, so the pairs close in space are
+# found once and every permutation only re-checks their time gaps. When that pair
+# list would exceed MAX_SPATIAL_PAIRS, each permutation reruns the KD-tree pass instead.
+
+import numpy as np
+import networkx as nx
+import pandas as pd
+from scipy.spatial import cKDTree
+from parallel import process_pool, shared_array
+from profiling import profiled
+from spatial import to_days, to_metres
+
+MAX_SPATIAL_PAIRS = 50_000_000  # about 800 MB of pair indices and codes
+
+
+def close_pair_counts(xy, days, category, n_categories, distance, window):
+    """
+    Number of pairs of events within `distance` and `window` of each other, per
+    unordered pair of categories, as an (n_categories, n_categories) matrix with
+    the counts in the upper triangle (category a <= b).
+    """
+    order = np.argsort(days, kind='stable')
+    xy, days, category = xy[order], days[order], category[order]
+    bucket_width = window + 1
+    bucket = (days - days[0]) // bucket_width if len(days) else days
+    starts = np.flatnonzero(np.r_[True, np.diff(bucket) != 0]) if len(days) else np.array([], dtype='int64')
+    stops = np.r_[starts[1:], len(days)]
+
+    counts = np.zeros(n_categories * n_categories, dtype='int64')
+    trees = {}
+    for b, (lo, hi) in enumerate(zip(starts, stops)):
+        tree = trees.pop(b) if b in trees else cKDTree(xy[lo:hi])
+        i, j = [], []
+        # Pairs within the bucket
+        within = tree.query_pairs(distance, output_type='ndarray')
+        i.append(lo + within[:, 0])
+        j.append(lo + within[:, 1])
+        # Pairs with the next bucket, when it is adjacent in time
+        if b + 1 < len(starts) and bucket[starts[b + 1]] == bucket[lo] + 1:
+            next_lo, next_hi = starts[b + 1], stops[b + 1]
+            trees[b + 1] = cKDTree(xy[next_lo:next_hi])
+            across = tree.sparse_distance_matrix(trees[b + 1], distance, output_type='ndarray')
+            i.append(lo + across['i'])
+            j.append(next_lo + across['j'])
+        i = np.concatenate(i)
+        j = np.concatenate(j)
+        close = np.abs(days[i] - days[j]) <= window
+        a, c = category[i[close]], category[j[close]]
+        counts += np.bincount(np.minimum(a, c) * n_categories + np.maximum(a, c),
+                              minlength=n_categories * n_categories)
+    return counts.reshape(n_categories, n_categories)
+
+
+def spatial_pairs(xy, distance, category, n_categories):
+    """
+    Index arrays (i, j) of the pairs of events within `distance` of each other,
+    whatever their dates, and the code of their unordered category pair
+    (min * n_categories + max), as counted by close_pair_counts.
+    """
+    pairs = cKDTree(xy).query_pairs(distance, output_type='ndarray')
+    index_type = 'int32' if len(xy) < 2 ** 31 else 'int64'
+    i, j = pairs[:, 0].astype(index_type), pairs[:, 1].astype(index_type)
+    a, b = category[i], category[j]
+    return i, j, np.minimum(a, b) * n_categories + np.maximum(a, b)
+
+
+def _time_close_counts(days, i, j, pair_code, n_categories, window):
+    close = np.abs(days[i] - days[j]) <= window
+    return np.bincount(pair_code[close], minlength=n_categories * n_categories).reshape(n_categories, n_categories)
+
+
+def _permutation_block(seed, n_perms, n_categories, distance, window):
+    xy = shared_array('xy')
+    days = shared_array('days')
+    category = shared_array('category')
+    observed = shared_array('observed')
+    pairs = shared_array('pairs')
+    rng = np.random.default_rng(seed)
+    larger = np.zeros((n_categories, n_categories), dtype='int64')
+    total = np.zeros((n_categories, n_categories))
+    total_sq = np.zeros((n_categories, n_categories))
+    total_larger = 0
+    for _ in range(n_perms):
+        permuted = rng.permutation(days)
+        if pairs is not None:
+            sim = _time_close_counts(permuted, *pairs, n_categories, window)
+        else:
+            sim = close_pair_counts(xy, permuted, category, n_categories, distance, window)
+        larger += sim >= observed
+        total += sim
+        total_sq += sim.astype('float64') ** 2
+        total_larger += int(sim.sum() >= observed.sum())
+    # Only the summaries leave the worker, so memory does not grow with the permutations
+    return larger, total, total_sq, total_larger
+
+
+class Knox:
+    """
+    Knox test of space-time interaction between event categories.
+
+    `xy` are projected coordinates in metres, `days` integer days and
+    `category` integer codes in [0, n_categories). `observed` holds the number
+    of close pairs per category pair (upper triangle), `expected` its mean over
+    `permutations` random reassignments of the days, and `p_sim` the one-sided
+    pseudo p-values; `total`, `total_expected` and `total_p_sim` are the same for
+    all pairs together. Results depend only on `seed`, not on the number of workers.
+    With `permutations=0` only the observed counts are computed and the other
+    results are NaN.
+    """
+
+    def __init__(self, xy, days, category, n_categories=None, distance=200, window=7, permutations=999,
+                 seed=12345, max_workers=None, block=10):
+        xy = np.asarray(xy, dtype='float64')
+        days = np.asarray(days, dtype='int64')
+        category = np.asarray(category, dtype='int64')
+        n_categories = n_categories or int(category.max()) + 1
+        self.distance = distance
+        self.window = window
+        self.permutations = permutations
+        self.observed = close_pair_counts(xy, days, category, n_categories, distance, window)
+        self.total = int(self.observed.sum())
+        self.expected = self.std = self.p_sim = np.full(self.observed.shape, np.nan)
+        self.total_expected = self.total_p_sim = np.nan
+
+        if permutations:
+            # Spatial pairs once for all permutations, unless there are too many to hold
+            tree = cKDTree(xy)
+            n_spatial = (int(tree.count_neighbors(tree, distance)) - len(xy)) // 2
+            pairs = spatial_pairs(xy, distance, category, n_categories) if n_spatial <= MAX_SPATIAL_PAIRS else None
+            blocks = [block] * (permutations // block) + ([permutations % block] if permutations % block else [])
+            seeds = np.random.SeedSequence(seed).spawn(len(blocks))
+            shared = {'xy': xy, 'days': days, 'category': category, 'observed': self.observed, 'pairs': pairs}
+            with process_pool(max_workers=max_workers, shared=shared) as pool:
+                results = list(pool.map(_permutation_block, seeds, blocks, [n_categories] * len(blocks),
+                                        [distance] * len(blocks), [window] * len(blocks)))
+            larger = sum(r[0] for r in results)
+            total = sum(r[1] for r in results)
+            total_sq = sum(r[2] for r in results)
+            self.expected = total / permutations
+            self.std = np.sqrt(np.maximum(total_sq / permutations - self.expected ** 2, 0))
+            self.p_sim = (larger + 1.0) / (permutations + 1.0)
+            self.total_expected = float(self.expected.sum())
+            self.total_p_sim = (sum(r[3] for r in results) + 1.0) / (permutations + 1.0)
+
+
+@profiled()
+def offense_knox(crimes, distance=200, window=7, category_col='OFNS_DESC', date_col='CMPLNT_FR_DT',
+                 lat_col='Latitude', lon_col='Longitude', **kwargs):
+    """
+    Knox test over a complaint table. Returns (knox, pairs) where `pairs` has
+    one row per offense pair with any observed or expected close pairs: the
+    observed and expected counts, their ratio and the pseudo p-value (NaN
+    without permutations). Complaints without a date, coordinates or offense
+    are left out.
+    """
+    days, missing = to_days(crimes[date_col])
+    missing |= crimes[[lat_col, lon_col, category_col]].isna().any(axis=1).to_numpy()
+    keep = np.flatnonzero(~missing)
+    category, offenses = pd.factorize(crimes[category_col].to_numpy()[keep], sort=True)
+    xy = to_metres(crimes[lat_col].to_numpy()[keep], crimes[lon_col].to_numpy()[keep])
+    knox = Knox(xy, days[keep], category, len(offenses), distance=distance, window=window, **kwargs)
+
+    a, b = np.triu_indices(len(offenses))
+    pairs = pd.DataFrame({
+        'offense_a': offenses[a], 'offense_b': offenses[b],
+        'observed': knox.observed[a, b],
+        'expected': knox.expected[a, b],
+    })
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pairs['ratio'] = pairs['observed'] / pairs['expected']
+    pairs['p_sim'] = knox.p_sim[a, b]
+    pairs = pairs[(pairs['observed'] > 0) | (pairs['expected'] > 0)]
+    return knox, pairs.reset_index(drop=True)
+
+
+def knox_network(pairs, alpha=0.05, weight='observed'):
+    """
+    Offense x offense network of the pairs that interact more than by chance
+    (p_sim < alpha and more close pairs than expected), weighted by `weight`.
+    Same-offense pairs are left out.
+    """
+    if len(pairs) and pairs['p_sim'].isna().all():
+        raise ValueError("The pairs have no p-values; run offense_knox with permutations > 0")
+    significant = pairs[(pairs['p_sim'] < alpha) & (pairs['observed'] > pairs['expected'])
+                        & (pairs['offense_a'] != pairs['offense_b'])]
+    G = nx.Graph()
+    G.add_weighted_edges_from(zip(significant['offense_a'], significant['offense_b'], significant[weight]))
+    return G
@@ -1,111 +1,123 @@
 # This modeling script was abondoned due to its poor results and the lack of importance of crime classification in the project.
 
 import pandas as pd
-from sklearn.model_selection import train_test_split
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.neural_network import MLPClassifier
-from sklearn.preprocessing import LabelEncoder, OneHotEncoder, StandardScaler
-from sklearn.compose import ColumnTransformer
-from sklearn.impute import SimpleImputer
-from sklearn.pipeline import Pipeline
-from sklearn.metrics import precision_score, recall_score, f1_score, accuracy_score
-
-# Load datasets
-crime_data = pd.read_csv("../code/sampled_crime_data.csv")
-urban_data = pd.read_csv("../code/filtered_urban_data.csv")
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import LabelEncoder
+from store import load_dataset
+from ingest import iter_chunks
+from training import (collapse_rare, design_matrix, fill_category, hash_features, standardize_columns, stream_classes,
+                      train_classifiers, train_streaming_classifiers)
+from profiling import rows_out, step
+from activity import ActivePermits
+
+# Streaming mode trains incremental models on the full 2016-2019 complaint history
+# (the raw CSV read in chunks, categoricals hashed into HASH_FEATURES columns)
+# instead of the 100k sample; memory is bounded by CHUNK_SIZE
+STREAMING = False
+CRIME_RAW_PATH = "Book1.csv"
+CHUNK_SIZE = 500000
+HASH_FEATURES = 2 ** 12
 
 # Preprocess Urban Development Data
-urban_data['Filing Date'] = pd.to_datetime(urban_data['Filing Date'])
-urban_summary = urban_data.groupby(['BOROUGH']).size().reset_index(name='active_projects')
-
-# Merge crime data with urban data
-crime_data['CMPLNT_FR_DT'] = pd.to_datetime(crime_data['CMPLNT_FR_DT'])
-crime_data = crime_data.merge(urban_summary, left_on='BORO_NM', right_on='BOROUGH', how='left')
-
-# Feature Engineering
-crime_data['DayOfWeek'] = crime_data['CMPLNT_FR_DT'].dt.dayofweek  # Add day of the week
-crime_data = crime_data.drop(columns=['CMPLNT_FR_DT', 'BOROUGH'])
+# active_projects is the number of permits under way (issued and not expired) in the
+# complaint's borough on the day of the complaint
+step("Preprocess urban development data")
+urban_data = load_dataset('urban', columns=['BOROUGH', 'Filing Date', 'Issuance Date', 'Expiration Date'])
+active_permits = ActivePermits.from_frame(urban_data)
+rows_out(active_permits.n_permits)
 
-# Combine rare classes into "OTHER" for better class balance
 threshold = 50  # Minimum number of samples for a class
-crime_data['OFNS_DESC'] = crime_data['OFNS_DESC'].fillna('UNKNOWN')
-value_counts = crime_data['OFNS_DESC'].value_counts()
-crime_data['OFNS_DESC'] = crime_data['OFNS_DESC'].apply(
-    lambda x: x if value_counts[x] > threshold else 'OTHER'
-)
-
-# Select relevant features and target
-features = ['BORO_NM', 'LAW_CAT_CD', 'PREM_TYP_DESC', 'DayOfWeek', 'active_projects']
+categorical_features = ['BORO_NM', 'LAW_CAT_CD', 'PREM_TYP_DESC']
+numeric_features = ['active_projects', 'DayOfWeek']
 target = 'OFNS_DESC'  # Crime type
-crime_data = crime_data.dropna(subset=[target])  # Drop missing target values
-
-# Encode target variable
-le = LabelEncoder()
-y = le.fit_transform(crime_data[target])
-
-# Preprocessing pipelines
-# Pipeline for MultinomialNB: No scaling
-preprocessor_nb = ColumnTransformer(
-    transformers=[
-        ('cat', Pipeline([
-            ('impute', SimpleImputer(strategy='most_frequent')),
-            ('encode', OneHotEncoder(handle_unknown='ignore'))
-        ]), ['BORO_NM', 'LAW_CAT_CD', 'PREM_TYP_DESC']),
-        ('num', SimpleImputer(strategy='constant', fill_value=0), ['active_projects', 'DayOfWeek'])
-    ],
-    remainder='passthrough'
-)
-
-# Pipeline for other classifiers: Include scaling
-preprocessor_scaled = ColumnTransformer(
-    transformers=[
-        ('cat', Pipeline([
-            ('impute', SimpleImputer(strategy='most_frequent')),
-            ('encode', OneHotEncoder(handle_unknown='ignore'))
-        ]), ['BORO_NM', 'LAW_CAT_CD', 'PREM_TYP_DESC']),
-        ('num', Pipeline([
-            ('impute', SimpleImputer(strategy='constant', fill_value=0)),
-            ('scale', StandardScaler())
-        ]), ['active_projects', 'DayOfWeek'])
-    ],
-    remainder='passthrough'
-)
-
-# Preprocess data for both pipelines
-X_nb = preprocessor_nb.fit_transform(crime_data[features])  # For MultinomialNB
-X_scaled = preprocessor_scaled.fit_transform(crime_data[features])  # For others
-
-# Split data
-X_nb_train, X_nb_test, y_train, y_test = train_test_split(X_nb, y, test_size=0.2, random_state=42)
-X_scaled_train, X_scaled_test, _, _ = train_test_split(X_scaled, y, test_size=0.2, random_state=42)
-
-# Initialize classifiers
-classifiers = {
-    "Naive Bayes": (MultinomialNB(), X_nb_train, X_nb_test),
-    "Decision Tree": (DecisionTreeClassifier(), X_scaled_train, X_scaled_test),
-    "Neural Network (MLP)": (MLPClassifier(hidden_layer_sizes=(128, 64), activation='relu',
-                                           solver='adam', max_iter=300, random_state=42),
-                             X_scaled_train, X_scaled_test)
-}
-
-# Train models and evaluate on the test set
-results = {}
-for name, (clf, X_train, X_test) in classifiers.items():
-    print()
-    clf.fit(X_train, y_train)
-    y_pred = clf.predict(X_test)
-
-    results[name] = {
-        'Accuracy': accuracy_score(y_test, y_pred),
-        'Precision': precision_score(y_test, y_pred, average='weighted', zero_division=0),
-        'Recall': recall_score(y_test, y_pred, average='weighted', zero_division=0),
-        'F1-Score': f1_score(y_test, y_pred, average='weighted', zero_division=0)
+
+if STREAMING:
+    crime_columns = ['BORO_NM', 'LAW_CAT_CD', 'PREM_TYP_DESC', 'OFNS_DESC', 'CMPLNT_FR_DT']
+
+    def crime_chunks():
+        for chunk in iter_chunks(CRIME_RAW_PATH, crime_columns, 'CMPLNT_FR_DT', '2016-01-01', '2019-12-31',
+                                 chunksize=CHUNK_SIZE):
+            chunk[target] = chunk[target].fillna('UNKNOWN')
+            yield chunk
+
+    # One pass over the target only, to fix the classes before any model sees a chunk
+    step("Collect target classes")
+    classes, kept_classes = stream_classes(crime_chunks, target, threshold)
+    max_active = max(active_permits.daily().to_numpy().max(), 1)
+
+    def prepare(chunk):
+        features = pd.DataFrame({
+            'BORO_NM': chunk['BORO_NM'], 'LAW_CAT_CD': chunk['LAW_CAT_CD'], 'PREM_TYP_DESC': chunk['PREM_TYP_DESC'],
+            # Numeric features scaled by known constants, so no pass over the data is needed
+            'active_projects': active_permits.at(chunk['BORO_NM'], chunk['CMPLNT_FR_DT']) / max_active,
+            'DayOfWeek': chunk['CMPLNT_FR_DT'].dt.dayofweek / 6,
+        })
+        X = hash_features(features, categorical_features, numeric_features, n_features=HASH_FEATURES)
+        y = chunk[target].where(chunk[target].isin(kept_classes), 'OTHER').to_numpy()
+        return X, y
+
+    # Classifiers that can be updated chunk by chunk
+    step("Train incremental classifiers")
+    classifiers = {
+        "Naive Bayes": MultinomialNB(),
+        "Linear (SGD, log loss)": SGDClassifier(loss='log_loss', random_state=42),
+        "Neural Network (MLP)": MLPClassifier(hidden_layer_sizes=(128, 64), activation='relu',
+                                              solver='adam', random_state=42),
+    }
+    results, models = train_streaming_classifiers(crime_chunks, prepare, classifiers, classes, test_size=0.2)
+    rows_out(int(results['Test rows'].iloc[0]))
+
+    print("Classifier Performance (Streaming, Held-Out Test Stream):")
+    print(results.to_string(float_format='{:.4f}'.format))
+else:
+    # Load datasets (dates come back parsed)
+    step("Load crime data")
+    crime_data = load_dataset('crime', columns=['BORO_NM', 'LAW_CAT_CD', 'PREM_TYP_DESC', 'OFNS_DESC', 'CMPLNT_FR_DT'])
+
+    # Permits under way at each complaint
+    step("Feature engineering", rows_in=len(crime_data))
+    crime_data['active_projects'] = active_permits.at(crime_data['BORO_NM'], crime_data['CMPLNT_FR_DT'])
+
+    # Feature Engineering
+    crime_data['DayOfWeek'] = crime_data['CMPLNT_FR_DT'].dt.dayofweek  # Add day of the week
+    crime_data = crime_data.drop(columns=['CMPLNT_FR_DT'])
+
+    # Combine rare classes into "OTHER" for better class balance
+    crime_data['OFNS_DESC'] = collapse_rare(fill_category(crime_data['OFNS_DESC'], 'UNKNOWN'), threshold)
+
+    # Select relevant features and target
+    crime_data = crime_data.dropna(subset=[target])  # Drop missing target values
+
+    # Encode target variable
+    le = LabelEncoder()
+    y = le.fit_transform(crime_data[target])
+    rows_out(len(crime_data))
+
+    step("Encode the design matrices", rows_in=len(crime_data))
+    # Encode the features once (cached on disk): one-hot categories followed by the numeric columns.
+    # MultinomialNB uses it unscaled; the other classifiers use a copy with the numeric columns standardized.
+    X_nb, feature_names = design_matrix(crime_data, categorical_features, numeric_features)
+    X_scaled = standardize_columns(X_nb, range(X_nb.shape[1] - len(numeric_features), X_nb.shape[1]))
+    # Like ColumnTransformer, keep the matrices sparse only when they are mostly zeros (dense is faster for the MLP)
+    if X_nb.nnz / (X_nb.shape[0] * X_nb.shape[1]) >= 0.3:
+        X_nb, X_scaled = X_nb.toarray(), X_scaled.toarray()
+
+    # Initialize classifiers with the design matrix each one is trained on
+    step("Train and evaluate classifiers", rows_in=len(y))
+    classifiers = {
+        "Naive Bayes": (MultinomialNB(), 'unscaled'),
+        "Decision Tree": (DecisionTreeClassifier(), 'scaled'),
+        "Neural Network (MLP)": (MLPClassifier(hidden_layer_sizes=(128, 64), activation='relu',
+                                               solver='adam', max_iter=300, random_state=42), 'scaled')
     }
 
-# Report results
-print("Classifier Performance (Post-Hoc Evaluation on Test Set):")
-for clf_name, metrics in results.items():
-    print(f"\n{clf_name}:")
-    for metric, score in metrics.items():
-        print(f"  {metric}: {score:.4f}")
+    # Train all models concurrently on the same split and evaluate them on the test set
+    results, models = train_classifiers(classifiers, {'unscaled': X_nb, 'scaled': X_scaled}, y,
+                                        test_size=0.2, random_state=42)
+
+    # Report results
+    print("Classifier Performance (Post-Hoc Evaluation on Test Set):")
+    print(results.to_string(float_format='{:.4f}'.format))
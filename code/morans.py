@@ -1,77 +1,123 @@
-# Moran's I spatial autocorrelation was attempted but failed due to python version issues
+# Moran's I spatial autocorrelation was first attempted with pysal, which failed due to python version issues.
+# It now uses the in-project sparse implementation in autocorrelation.py.
 
-import pandas as pd
-import geopandas as gpd
 import matplotlib.pyplot as plt
-import numpy as np
-from pysal.explore.esda import Moran, Moran_Local
-from pysal.lib import weights
-from shapely.geometry import Point, Polygon
-from pysal.viz.splot.esda import moran_scatterplot, lisa_cluster
-
-# Load crime and urban development datasets
-crime_data = pd.read_csv("crime_data.csv")
-urban_data = pd.read_csv("urban_data.csv")
+from matplotlib.patches import Patch
+from autocorrelation import Moran, MoranLocal, knn_weights, queen_weights
+from store import load_dataset
+from grid import Grid
+from hotspots import PATTERNS, emerging_hotspots, space_time_cube
+from profiling import rows_out, step
+from figures import figure, render_figures
+
+# Load crime and urban development datasets (coordinates, and complaint dates for the space-time cube)
+step("Load datasets")
+crime_data = load_dataset('crime', columns=['Latitude', 'Longitude', 'CMPLNT_FR_DT'])
+urban_data = load_dataset('urban', columns=['LATITUDE', 'LONGITUDE'])
 
 # Drop rows with missing latitude/longitude
 crime_data = crime_data.dropna(subset=["Latitude", "Longitude"])
 urban_data = urban_data.dropna(subset=["LATITUDE", "LONGITUDE"])
 
-# Convert to GeoDataFrames
-crime_gdf = gpd.GeoDataFrame(crime_data,
-                             geometry=gpd.points_from_xy(crime_data['Longitude'], crime_data['Latitude']),
-                             crs="EPSG:4326")
-
-urban_gdf = gpd.GeoDataFrame(urban_data,
-                             geometry=gpd.points_from_xy(urban_data['LONGITUDE'], urban_data['LATITUDE']),
-                             crs="EPSG:4326")
-
 # Create a grid for spatial aggregation
+step("Grid aggregation", rows_in=len(crime_data) + len(urban_data))
 grid_size = 0.01  # Grid resolution (degrees)
-xmin, ymin, xmax, ymax = crime_gdf.total_bounds
-x_coords = np.arange(xmin, xmax, grid_size)
-y_coords = np.arange(ymin, ymax, grid_size)
-
-grid_cells = [Polygon([(x, y), (x + grid_size, y), (x + grid_size, y + grid_size), (x, y + grid_size)])
-              for x in x_coords for y in y_coords]
-grid = gpd.GeoDataFrame(geometry=grid_cells, crs="EPSG:4326")
+crime_grid = Grid.from_points(crime_data['Longitude'], crime_data['Latitude'], resolution=grid_size)
 
-# Spatial join to count crime and urban projects within grid cells
-grid['crime_count'] = gpd.sjoin(grid, crime_gdf, how="left", predicate="intersects").groupby(grid.index).size()
-grid['urban_count'] = gpd.sjoin(grid, urban_gdf, how="left", predicate="intersects").groupby(grid.index).size()
+# Count crime and urban projects per grid cell; each point falls in exactly one cell
+counts = crime_grid.count_layers({
+    'crime_count': (crime_data['Longitude'], crime_data['Latitude']),
+    'urban_count': (urban_data['LONGITUDE'], urban_data['LATITUDE']),
+})
 
-# Fill missing values with 0
-grid['crime_count'] = grid['crime_count'].fillna(0)
-grid['urban_count'] = grid['urban_count'].fillna(0)
+grid = crime_grid.to_frame(counts)
+rows_out(len(grid))
 
-# Spatial Weights Matrix for Moran's I
-w = weights.KNN.from_dataframe(grid, k=8)
-w.transform = 'R'
+# Spatial Weights Matrix for Moran's I (row-standardized)
+step("Spatial weights", rows_in=len(grid))
+WEIGHTS = 'knn'  # 'knn' (k=8 nearest cell centres) or 'queen' (grid contiguity)
+if WEIGHTS == 'queen':
+    w = queen_weights(crime_grid.n_rows, crime_grid.n_cols)
+else:
+    w = knn_weights(grid[['x_center', 'y_center']], k=8)
 
 # Moran's I - Global Spatial Autocorrelation for Crime Counts
-moran_global = Moran(grid['crime_count'], w)
+step("Global Moran's I", rows_in=len(grid))
+moran_global = Moran(grid['crime_count'], w, permutations=999)
 print(f"Global Moran's I: {moran_global.I:.4f}, p-value: {moran_global.p_sim:.4f}")
 
 # Local Moran's I for identifying spatial clusters
-moran_local = Moran_Local(grid['crime_count'], w)
+step("Local Moran's I", rows_in=len(grid))
+moran_local = MoranLocal(grid['crime_count'], w, permutations=999)
+grid['lisa_clusters'] = moran_local.q
+grid['lisa_p'] = moran_local.p_sim
+print(f"Significant LISA cells (p < 0.05): {(moran_local.p_sim < 0.05).sum()} of {len(grid)}")
+
+# Emerging hotspots: Getis-Ord Gi* on a cell x month space-time cube, with a
+# Mann-Kendall trend test of every cell's Gi* series (see hotspots.py)
+step("Emerging hotspots", rows_in=len(crime_data))
+HOTSPOT_GRID_SIZE = 0.005  # degrees
+HOTSPOT_TIME_WINDOW = 1  # months either side in the space-time neighbourhood
+hotspot_grid = Grid.from_points(crime_data['Longitude'], crime_data['Latitude'], resolution=HOTSPOT_GRID_SIZE)
+cube, months = space_time_cube(hotspot_grid, crime_data['Longitude'], crime_data['Latitude'],
+                               crime_data['CMPLNT_FR_DT'])
+gi_scores, hotspots = emerging_hotspots(cube, hotspot_grid.n_rows, hotspot_grid.n_cols,
+                                        time_window=HOTSPOT_TIME_WINDOW)
+rows_out(len(hotspots))
+print(f"\nEmerging hotspot categories ({len(hotspots)} cells x {len(months)} months):")
+print(hotspots['category'].value_counts()[lambda counts: counts > 0].to_string())
+
+# Cell polygons are only needed for the maps below
+step("Visualization", rows_in=len(grid))
+grid = crime_grid.to_geodataframe(grid)
+hotspots = hotspot_grid.to_geodataframe(hotspot_grid.cells().loc[hotspots.index].join(hotspots))
 
 # Visualization of Local Moran's I (LISA Clusters)
-fig, ax = plt.subplots(1, 2, figsize=(14, 7))
+@figure('lisa_clusters')
+def plot_lisa_clusters():
+    fig, ax = plt.subplots(1, 2, figsize=(14, 7))
 
-# LISA cluster map
-grid['lisa_clusters'] = moran_local.q
-grid.plot(column='lisa_clusters', cmap='coolwarm', legend=True, ax=ax[0])
-ax[0].set_title("Local Moran's I Clusters (Crime Density)")
+    # LISA cluster map
+    grid.plot(column='lisa_clusters', cmap='coolwarm', legend=True, ax=ax[0])
+    ax[0].set_title("Local Moran's I Clusters (Crime Density)")
+
+    # Overlay urban development density
+    grid.plot(column='urban_count', cmap='Blues', legend=True, ax=ax[1])
+    ax[1].set_title("Urban Development Density Heatmap")
 
-# Overlay urban development density
-grid.plot(column='urban_count', cmap='Blues', legend=True, ax=ax[1])
-ax[1].set_title("Urban Development Density Heatmap")
+    plt.tight_layout()
 
-plt.tight_layout()
-plt.show()
 
 # Moran's I Scatter Plot
-fig, ax = plt.subplots(figsize=(7, 5))
-moran_scatterplot(moran_global, ax=ax)
-ax.set_title("Global Moran's I Scatter Plot for Crime Density")
-plt.show()
\ No newline at end of file
+@figure('moran_scatter')
+def plot_moran_scatter():
+    fig, ax = plt.subplots(figsize=(7, 5))
+    ax.scatter(moran_local.z, moran_local.lag, s=5, alpha=0.5)
+    ax.plot(moran_local.z, moran_global.I * moran_local.z, color='red', linewidth=1)
+    ax.axvline(0, color='gray', linewidth=0.5)
+    ax.axhline(0, color='gray', linewidth=0.5)
+    ax.set_xlabel("Crime count (deviation from mean)")
+    ax.set_ylabel("Spatial lag")
+    ax.set_title("Global Moran's I Scatter Plot for Crime Density")
+
+
+# Emerging hotspot map: hot patterns in reds, cold ones in blues
+@figure('emerging_hotspots')
+def plot_emerging_hotspots():
+    fig, ax = plt.subplots(figsize=(10, 10))
+    handles = []
+    for kind, cmap in [('Hot', plt.cm.Reds), ('Cold', plt.cm.Blues)]:
+        for i, pattern in enumerate(PATTERNS):
+            cells = hotspots[hotspots['category'] == f'{pattern} {kind} Spot']
+            if cells.empty:
+                continue
+            color = cmap(0.3 + 0.6 * i / (len(PATTERNS) - 1))
+            cells.plot(ax=ax, color=color, linewidth=0)
+            handles.append(Patch(color=color, label=f'{pattern} {kind} Spot ({len(cells)})'))
+    ax.legend(handles=handles, loc='upper left', fontsize=8)
+    ax.set_title("Emerging Crime Hotspots, 2016-2019 (Gi* with Mann-Kendall trend)")
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+
+
+render_figures()
@@ -1,36 +1,30 @@
 import networkx as nx
-import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Patch
+from cube import load_cube
+from bipartite import incidence_matrix, to_networkx
+from store import load_dataset
+from knox import offense_knox, knox_network
+from profiling import rows_out, step
+from figures import figure, render_figures
 
-# Load datasets
-crime_data = pd.read_csv('../code/sampled_crime_data.csv')
-urban_data = pd.read_csv('../code/filtered_urban_data.csv')
+# Offense x borough counts, rolled up from the crime count cube
+step("Offense x borough incidence matrix")
+crime_cooccur = load_cube('crime').rollup(['OFNS_DESC', 'BORO_NM']).reset_index(name='count')
 
-# Group by OFNS_DESC and BORO_NM, count occurrences
-crime_cooccur = crime_data.groupby(['OFNS_DESC', 'BORO_NM']).size().reset_index(name='count')
+# Offense x borough incidence matrix, straight from the grouped counts
+incidence, offenses, boroughs = incidence_matrix(crime_cooccur, 'OFNS_DESC', 'BORO_NM')
+rows_out(incidence.shape[0])
 
 # Identify the top 10 crimes by total count across boroughs
-top_crimes = (
-    crime_cooccur.groupby('OFNS_DESC')['count']
-    .sum()
-    .sort_values(ascending=False)
-    .head(10)
-    .index
-)
-
-# Filter the data to include only the top crimes
-filtered_crime_cooccur = crime_cooccur[crime_cooccur['OFNS_DESC'].isin(top_crimes)]
-
-# Create a graph
-G = nx.Graph()
-
-# Add nodes and weighted edges
-for _, row in filtered_crime_cooccur.iterrows():
-    crime = row['OFNS_DESC']
-    borough = row['BORO_NM']
-    weight = row['count']
-    G.add_edge(crime, borough, weight=weight)
+offense_totals = np.asarray(incidence.sum(axis=1)).ravel()
+top_rows = np.argsort(-offense_totals, kind='stable')[:10]
+top_crimes = offenses[top_rows]
+
+# Create a graph of the top crimes and their boroughs
+G = to_networkx(incidence[top_rows], top_crimes, boroughs)
+G.remove_nodes_from([node for node, degree in dict(G.degree).items() if degree == 0])
 
 # Customize node properties
 node_colors = []
@@ -47,25 +41,66 @@ for node in G.nodes:
 edges = G.edges(data=True)
 edge_weights = [edge[2]['weight'] for edge in edges]  # Edge weights for thickness
 
+
 # Draw the graph
-plt.figure(figsize=(16, 12))
-pos = nx.spring_layout(G, seed=42)  # Improved layout for better spacing
-nx.draw(
-    G, pos, with_labels=True, node_size=node_sizes, font_size=12, font_color='black',
-    node_color=node_colors, edge_color='gray', width=[0.1 + w / max(edge_weights) * 2 for w in edge_weights],
-    font_weight='semibold'  # Set font weight to bold
-)
-edge_labels = nx.get_edge_attributes(G, 'weight')
-nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=10, font_weight='bold')
-
-# Add legend
-legend_elements = [
-    Patch(facecolor='skyblue', edgecolor='black', label='Crime Type (Top 10)'),
-    Patch(facecolor='lightgreen', edgecolor='black', label='Borough')
-]
-plt.legend(handles=legend_elements, loc='upper left', fontsize=12)
-
-# Title
-plt.title("Top 10 Crimes and Their Borough Associations", fontsize=18, fontweight='bold')
-plt.tight_layout()
-plt.show()
+@figure('top_crime_boroughs_network')
+def plot_top_crime_network():
+    plt.figure(figsize=(16, 12))
+    pos = nx.spring_layout(G, seed=42)  # Improved layout for better spacing
+    nx.draw(
+        G, pos, with_labels=True, node_size=node_sizes, font_size=12, font_color='black',
+        node_color=node_colors, edge_color='gray', width=[0.1 + w / max(edge_weights) * 2 for w in edge_weights],
+        font_weight='semibold'  # Set font weight to bold
+    )
+    edge_labels = nx.get_edge_attributes(G, 'weight')
+    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=10, font_weight='bold')
+
+    # Add legend
+    legend_elements = [
+        Patch(facecolor='skyblue', edgecolor='black', label='Crime Type (Top 10)'),
+        Patch(facecolor='lightgreen', edgecolor='black', label='Borough')
+    ]
+    plt.legend(handles=legend_elements, loc='upper left', fontsize=12)
+
+    # Title
+    plt.title("Top 10 Crimes and Their Borough Associations", fontsize=18, fontweight='bold')
+    plt.tight_layout()
+
+
+# Space-time co-occurrence: offenses whose complaints fall within KNOX_DISTANCE
+# metres and KNOX_WINDOW days of each other more often than under random dates
+KNOX_DISTANCE = 200  # metres
+KNOX_WINDOW = 7  # days
+KNOX_PERMUTATIONS = 999
+step("Knox space-time interaction test")
+crime_points = load_dataset('crime', columns=['OFNS_DESC', 'CMPLNT_FR_DT', 'Latitude', 'Longitude'])
+knox, knox_pairs = offense_knox(crime_points, distance=KNOX_DISTANCE, window=KNOX_WINDOW,
+                                permutations=KNOX_PERMUTATIONS)
+print(f"Knox test: {knox.total} close pairs, {knox.total_expected:.1f} expected, p-value: {knox.total_p_sim:.4f}")
+rows_out(len(knox_pairs))
+K = knox_network(knox_pairs, alpha=0.05)
+
+
+# Draw the offense x offense network of the significant pairs
+@figure('knox_network')
+def plot_knox_network():
+    if not K.number_of_edges():
+        return
+    knox_weights = [data['weight'] for _, _, data in K.edges(data=True)]
+    plt.figure(figsize=(16, 12))
+    pos = nx.spring_layout(K, seed=42)
+    nx.draw(
+        K, pos, with_labels=True, node_size=3000, font_size=10, node_color='skyblue', edge_color='gray',
+        width=[0.5 + w / max(knox_weights) * 4 for w in knox_weights]
+    )
+    nx.draw_networkx_edge_labels(K, pos, edge_labels=nx.get_edge_attributes(K, 'weight'), font_size=9)
+    plt.title(f"Offenses Co-occurring Within {KNOX_DISTANCE} m and {KNOX_WINDOW} Days (Knox, p < 0.05)",
+              fontsize=18, fontweight='bold')
+    plt.tight_layout()
+
+
+if not K.number_of_edges():
+    print("No offense pairs co-occur in space and time more than expected by chance.")
+
+step("Render figures")
+render_figures()
@@ -0,0 +1,42 @@
+# Process-pool helpers shared by the parallel engines.
+# The analysis scripts are top-level programs without a __main__ guard, so workers
+# are forked where the platform allows it: a spawned worker would re-run the script.
+# Forked workers also inherit the shared arrays without copying or pickling them.
+
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+_shared = {}
+
+
+def _init_worker(arrays, threads):
+    _shared.clear()
+    _shared.update(arrays)
+    if threads is not None:
+        # Avoid oversubscribing the cores with BLAS/OpenMP threads inside each worker
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=threads)
+
+
+def process_pool(max_workers=None, shared=None, threads_per_worker=1):
+    """
+    Create a ProcessPoolExecutor whose workers can read the arrays in `shared`
+    (a dict of name -> array) through `shared_array(name)`.
+
+    With the fork start method the arrays are inherited by the workers as-is;
+    elsewhere each worker receives one copy at start-up rather than one per task.
+    """
+    max_workers = max_workers or os.cpu_count()
+    context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else None
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(dict(shared or {}), threads_per_worker)
+    )
+
+
+def shared_array(name):
+    """Inside a worker, the array registered under `name` by process_pool."""
+    return _shared[name]
@@ -0,0 +1,285 @@
+# Cached, parallel runner for the analysis scripts.
+# Every script is declared as a stage with the files it reads and writes. A stage
+# is skipped when the content hash of its inputs, its code (the script and the
+# project modules it imports) and its parameters matches the last successful run
+# and its outputs are still in place. Stages whose inputs do not depend on each
+# other run at the same time in separate processes, so after a small data change
+# only the stages that actually see different inputs are re-run.
+#
+# Usage: python pipeline.py [stage ...] [--force] [--workers N]   (defaults to all stages)
+#
+# The figures of the charting scripts are exported headless to figures/<stage>/.
+#
+# cleaning.py is not a stage: it reads the raw Kaggle/Open Data exports, which are
+# not part of this repository. The pipeline starts from the cleaned CSVs it writes.
+
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+import pandas as pd
+from cube import build_cube, cube_path
+from parallel import process_pool, shared_array
+from store import CODE_DIR, DATA_DIR, csv_path, store_path, write_store
+
+PIPELINE_DIR = os.path.join(DATA_DIR, 'cache', 'pipeline')
+MANIFEST_PATH = os.path.join(PIPELINE_DIR, 'manifest.json')
+HASHES_PATH = os.path.join(PIPELINE_DIR, 'hashes.json')
+
+
+# ====================
+# Content hashes
+# ====================
+
+def _file_hash(path, memo):
+    # Files are only re-read when their size or modification time changed
+    stat = os.stat(path)
+    entry = memo.get(path)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['sha1']
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(block)
+    memo[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': digest.hexdigest()}
+    return memo[path]['sha1']
+
+
+def content_hash(path, memo):
+    """SHA-1 of a file, or of every file (and its relative path) under a directory; None if missing."""
+    path = os.path.normpath(path)
+    if os.path.isfile(path):
+        return _file_hash(path, memo)
+    if not os.path.isdir(path):
+        return None
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode())
+            digest.update(_file_hash(file_path, memo).encode())
+    return digest.hexdigest()
+
+
+def code_files(module_path):
+    """`module_path` and every project module it imports, directly or not."""
+    seen, pending = set(), [os.path.normpath(module_path)]
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        with open(path) as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                candidate = os.path.join(CODE_DIR, name.split('.')[0] + '.py')
+                if os.path.exists(candidate):
+                    pending.append(candidate)
+    return sorted(seen)
+
+
+# ====================
+# Stages
+# ====================
+
+class Stage:
+    """
+    A step of the pipeline: `run` is called in a worker process with the path
+    of the stage's log file, `code` is the module whose source (and imports) the
+    results depend on, and `inputs`/`outputs` are the files or directories read
+    and written. `params` are passed to the stage as environment variables and are
+    part of its cache key.
+    """
+
+    def __init__(self, name, run, code, inputs=(), outputs=(), params=None):
+        self.name = name
+        self.run = run
+        self.code = os.path.join(CODE_DIR, code)
+        self.inputs = [os.path.normpath(path) for path in inputs]
+        self.outputs = [os.path.normpath(path) for path in outputs]
+        self.params = dict(params or {})
+
+    def key(self, memo):
+        digest = hashlib.sha1(self.name.encode())
+        for path in code_files(self.code):
+            digest.update(os.path.basename(path).encode())
+            digest.update(content_hash(path, memo).encode())
+        for path in self.inputs:
+            digest.update(path.encode())
+            digest.update(str(content_hash(path, memo)).encode())
+        digest.update(json.dumps(self.params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+
+def script(name):
+    """Stage body running one of the analysis scripts in its own interpreter, output to the log."""
+    def run(log_path, params):
+        # A non-interactive backend, so the figures do not block the run
+        env = {**os.environ, 'MPLBACKEND': 'Agg', **{key: str(value) for key, value in params.items()}}
+        with open(log_path, 'w') as log:
+            subprocess.run([sys.executable, name], cwd=CODE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+                           check=True)
+    return run
+
+
+def build_stores(log_path, params):
+    """Parquet stores and count cubes of both datasets, from the cleaned CSVs."""
+    with open(log_path, 'w') as log:
+        for dataset in ('crime', 'urban'):
+            rows = pd.read_csv(csv_path(dataset), low_memory=False)
+            write_store(rows, dataset)
+            cube = build_cube(dataset)
+            log.write(f"{dataset}: {len(rows)} rows, {len(cube.counts)} cube cells\n")
+
+
+STORES = [store_path('crime'), store_path('urban')]
+CUBES = [cube_path('crime'), cube_path('urban')]
+FIGURES_OUTPUT_DIR = os.path.normpath(os.path.join(CODE_DIR, '..', 'figures'))
+
+
+def figure_stage(name, inputs):
+    """Stage for a script with figures: they are exported (see figures.py) to figures/<name>/."""
+    output_dir = os.path.join(FIGURES_OUTPUT_DIR, name)
+    return Stage(name, script(f'{name}.py'), f'{name}.py', inputs=inputs, outputs=[output_dir],
+                 params={'FIGURES_DIR': output_dir})
+
+
+STAGES = [
+    Stage('store', build_stores, __file__, inputs=[csv_path('crime'), csv_path('urban')], outputs=STORES + CUBES),
+    figure_stage('graphs', inputs=STORES + CUBES),
+    figure_stage('sta', inputs=STORES + CUBES),
+    figure_stage('networks', inputs=[store_path('crime'), cube_path('crime')]),
+    figure_stage('clustering', inputs=STORES),
+    figure_stage('morans', inputs=STORES),
+    Stage('redundancy', script('redundancy.py'), 'redundancy.py', inputs=[store_path('crime'), cube_path('crime')]),
+    Stage('modeling', script('modeling.py'), 'modeling.py', inputs=STORES),
+]
+
+
+# ====================
+# Runner
+# ====================
+
+def _load_json(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_json(data, path):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _run_stage(name):
+    # Stage bodies are closures, so they reach the worker through the fork rather than pickling
+    stage = shared_array('stages')[name]
+    start = time.perf_counter()
+    stage.run(os.path.join(PIPELINE_DIR, f'{stage.name}.log'), stage.params)
+    return time.perf_counter() - start
+
+
+def _upstream(stages):
+    """Stage name -> names of the stages writing one of its inputs (or a directory containing it)."""
+    writers = {path: stage.name for stage in stages for path in stage.outputs}
+    return {
+        stage.name: {writer for output, writer in writers.items()
+                     for path in stage.inputs if path == output or path.startswith(output + os.sep)} - {stage.name}
+        for stage in stages
+    }
+
+
+def run_pipeline(names=None, force=False, max_workers=None, stages=STAGES):
+    """
+    Run the named stages (all by default, plus the stages they depend on) and
+    return a frame with the status ('ran', 'cached', 'failed' or 'skipped') and
+    seconds of each. A stage is started as soon as the stages it depends on have
+    finished, and skipped when its cache key matches the last successful run.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    upstream = _upstream(stages)
+    selected, pending = set(), list(names or by_name)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending += upstream[name]
+
+    os.makedirs(PIPELINE_DIR, exist_ok=True)
+    manifest = _load_json(MANIFEST_PATH)
+    memo = _load_json(HASHES_PATH)
+    status, seconds, keys = {}, {}, {}
+    running = {}
+
+    with process_pool(max_workers=max_workers, shared={'stages': by_name}, threads_per_worker=None) as pool:
+        while len(status) < len(selected):
+            for name in sorted(selected - set(status) - set(running.values())):
+                deps = upstream[name] & selected
+                if not all(dep in status for dep in deps):
+                    continue
+                if any(status[dep] in ('failed', 'skipped') for dep in deps):
+                    status[name] = 'skipped'
+                    continue
+                # The key is computed once the upstream outputs are final
+                stage = by_name[name]
+                keys[name] = stage.key(memo)
+                previous = manifest.get(name, {})
+                outputs_intact = all(content_hash(path, memo) == digest
+                                     for path, digest in previous.get('outputs', {}).items())
+                if not force and previous.get('key') == keys[name] and outputs_intact:
+                    status[name], seconds[name] = 'cached', 0.0
+                    continue
+                running[pool.submit(_run_stage, name)] = name
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    seconds[name] = future.result()
+                except Exception as error:
+                    status[name] = 'failed'
+                    print(f"Stage '{name}' failed: {error} (log: {os.path.join(PIPELINE_DIR, name + '.log')})")
+                    continue
+                status[name] = 'ran'
+                manifest[name] = {
+                    'key': keys[name],
+                    'outputs': {path: content_hash(path, memo) for path in by_name[name].outputs},
+                }
+                _save_json(manifest, MANIFEST_PATH)
+                print(f"Stage '{name}' finished in {seconds[name]:.1f}s", flush=True)
+
+    _save_json(memo, HASHES_PATH)
+    return pd.DataFrame({'status': status, 'seconds': seconds}).reindex([s.name for s in stages if s.name in selected])
+
+
+args = sys.argv[1:]
+force = '--force' in args
+workers = int(args[args.index('--workers') + 1]) if '--workers' in args else None
+names = [arg for i, arg in enumerate(args) if not arg.startswith('--') and (i == 0 or args[i - 1] != '--workers')]
+unknown = set(names) - {stage.name for stage in STAGES}
+if unknown:
+    sys.exit(f"Unknown stages: {', '.join(sorted(unknown))}; available: {', '.join(s.name for s in STAGES)}")
+
+summary = run_pipeline(names or None, force=force, max_workers=workers)
+print()
+print(summary.round(1).to_string())
+print(f"\nStage logs in '{os.path.normpath(PIPELINE_DIR)}'")
+if (summary['status'] == 'failed').any():
+    sys.exit(1)
@@ -0,0 +1,214 @@
+# Time and memory measurement shared by the benchmark suite and the training harness.
+# Peak memory is the process's resident set size high-water mark, which Linux lets
+# us reset before a measured step, so each step reports only its own peak.
+
+import os
+import resource
+import time
+
+
+def reset_peak_rss():
+    """Reset this process's peak resident set size where the platform allows it (Linux)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def rss(field='VmRSS'):
+    """Current ('VmRSS') or peak ('VmHWM') resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Without /proc only the lifetime peak is known (in kilobytes on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def measure(func, *args, **kwargs):
+    """
+    Call func(*args, **kwargs) and return (result, stats), where stats holds the
+    wall and CPU seconds (including finished child processes, e.g. pool workers)
+    and the peak memory the call added to this process in MB.
+    """
+    reset_peak_rss()
+    baseline = rss('VmRSS')
+    cpu = _cpu_seconds()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    stats = {
+        'wall_s': time.perf_counter() - start,
+        'cpu_s': _cpu_seconds() - cpu,
+        'peak_rss_mb': max(rss('VmHWM') - baseline, 0) / 2 ** 20,
+    }
+    return result, stats
+
+
+# ==========================
+# Step instrumentation
+# ==========================
+# Scripts mark their logical steps with step("..."), and library hot spots are
+# decorated with @profiled. Both do nothing unless the PROFILE environment
+# variable is set (e.g. PROFILE=1 python sta.py); then every step records wall
+# and CPU time, peak RSS (and the tracemalloc peak with PROFILE_TRACEMALLOC=1) and
+# rows in/out, appends it to a JSON-lines trace in PROFILE_DIR (default
+# ../profiles) and a summary table is printed when the script exits.
+
+ENABLED = os.environ.get('PROFILE', '') not in ('', '0')
+TRACEMALLOC = os.environ.get('PROFILE_TRACEMALLOC', '') not in ('', '0')
+PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'profiles')
+
+
+class _Record:
+    def __init__(self, name, kind, rows_in, parent):
+        self.name = name
+        self.kind = kind
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.parent = parent
+        self.peak = 0
+        self.start = time.perf_counter()
+        self.cpu = _cpu_seconds()
+        self.baseline = rss('VmRSS')
+
+
+class _Trace:
+    """Open records of this process and the trace file they are written to."""
+
+    def __init__(self):
+        import atexit
+        import json
+        import sys
+        self.json = json
+        self.script = os.path.splitext(os.path.basename(sys.argv[0] or 'interactive'))[0]
+        self.run = f"{self.script}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.current_step = None
+        self.spans = []
+        self.records = []
+        self.path = os.path.normpath(os.path.join(PROFILE_DIR, f'{self.run}.jsonl'))
+        if TRACEMALLOC:
+            import tracemalloc
+            tracemalloc.start()
+        atexit.register(self.finish)
+
+    def _open(self):
+        return ([self.current_step] if self.current_step else []) + self.spans
+
+    def begin(self, name, kind, rows_in):
+        # Resetting the high-water mark would hide the peak of the records still open
+        hwm = rss('VmHWM')
+        for record in self._open():
+            record.peak = max(record.peak, hwm)
+        reset_peak_rss()
+        if TRACEMALLOC:
+            import tracemalloc
+            tracemalloc.reset_peak()
+        parent = self.spans[-1].name if self.spans else (self.current_step.name if self.current_step else None)
+        return _Record(name, kind, rows_in, parent)
+
+    def end(self, record):
+        hwm = max(record.peak, rss('VmHWM'))
+        for other in self._open():
+            other.peak = max(other.peak, hwm)
+        entry = {
+            'run': self.run, 'script': self.script, 'kind': record.kind, 'name': record.name,
+            'parent': record.parent, 'start_s': record.start - self.origin,
+            'wall_s': time.perf_counter() - record.start, 'cpu_s': _cpu_seconds() - record.cpu,
+            'peak_rss_mb': max(hwm - record.baseline, 0) / 2 ** 20, 'rss_mb': rss('VmRSS') / 2 ** 20,
+            'rows_in': record.rows_in, 'rows_out': record.rows_out,
+        }
+        if TRACEMALLOC:
+            import tracemalloc
+            entry['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        self.records.append(entry)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(self.json.dumps(entry) + '\n')
+
+    def finish(self):
+        # Forked workers inherit the trace but must not close the parent's steps
+        if os.getpid() != self.pid:
+            return
+        if self.current_step:
+            self.end(self.current_step)
+            self.current_step = None
+        if not self.records:
+            return
+        import pandas as pd
+        summary = pd.DataFrame(self.records).sort_values('start_s', kind='stable')
+        summary = summary.astype({'rows_in': 'Int64', 'rows_out': 'Int64'})
+        # Spans are indented under the step they ran in
+        names = [('  ' if kind == 'span' else '') + name for kind, name in zip(summary['kind'], summary['name'])]
+        summary['name'] = [name.ljust(max(map(len, names))) for name in names]
+        columns = ['name', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rows_in', 'rows_out']
+        print(f"\nProfile of {self.script} (trace: {self.path})")
+        print(summary[columns].to_string(index=False, float_format='{:.3f}'.format))
+
+
+_trace = None
+
+
+def _get_trace():
+    global _trace
+    if _trace is None:
+        _trace = _Trace()
+    return _trace
+
+
+def step(name, rows_in=None):
+    """
+    Mark the start of a logical step of a script; the previous step ends here.
+    `rows_in` is the number of rows the step starts from (see also rows_out).
+    """
+    if not ENABLED:
+        return
+    trace = _get_trace()
+    if trace.current_step:
+        trace.end(trace.current_step)
+        trace.current_step = None
+    trace.current_step = trace.begin(name, 'step', rows_in)
+
+
+def rows_out(n):
+    """Record the number of rows the current step produced."""
+    if ENABLED and _get_trace().current_step:
+        _get_trace().current_step.rows_out = n
+
+
+def profiled(name=None):
+    """Decorator recording every call of a library function as a span of the current step."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        import functools
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = _get_trace()
+            # Rows in/out are those of the first array-like argument and of an array-like result
+            rows_in = next((arg.shape[0] for arg in args if getattr(arg, 'shape', None)), None)
+            record = trace.begin(name or func.__name__, 'span', rows_in)
+            trace.spans.append(record)
+            try:
+                result = func(*args, **kwargs)
+                if getattr(result, 'shape', None):
+                    record.rows_out = result.shape[0]
+                return result
+            finally:
+                trace.spans.pop()
+                trace.end(record)
+        return wrapper
+    return decorate
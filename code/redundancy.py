@@ -1,38 +1,44 @@
 # This redundancy script was abandoned in favour of the clustering and reduncancy done along with geospatial analysis in the clustering.py script.
 
-import networkx as nx
-import pandas as pd
-from itertools import combinations
-
-# Load datasets
-crime_data = pd.read_csv('../code/sampled_crime_data.csv')
-urban_data = pd.read_csv('../code/filtered_urban_data.csv')
-
-# Group the data by BORO_NM and OFNS_DESC to compute counts
-crime_counts = crime_data.groupby(['BORO_NM', 'OFNS_DESC']).size().reset_index(name='count')
-
-# Create a bipartite graph
-G = nx.Graph()
-for _, row in crime_counts.iterrows():
-    G.add_edge(row['BORO_NM'], row['OFNS_DESC'], weight=row['count'])
-
-# Project to a unipartite crime graph
-crime_nodes = crime_counts['OFNS_DESC'].unique()
-crime_graph = nx.bipartite.weighted_projected_graph(G, crime_nodes)
+from cube import load_cube
+from store import load_dataset
+from grid import Grid
+from bipartite import incidence_matrix, project, weighted_clustering, redundancy as node_redundancy
+from profiling import rows_out, step
+
+# Locations the offense types are linked through: 'borough' (from the crime count
+# cube) or 'grid' (cells of GRID_RESOLUTION degrees)
+LOCATION_LEVEL = 'borough'
+GRID_RESOLUTION = 0.01
+
+step("Offense x location counts")
+if LOCATION_LEVEL == 'grid':
+    crime_data = load_dataset('crime', columns=['OFNS_DESC', 'Latitude', 'Longitude'])
+    crime_data = crime_data.dropna(subset=['Latitude', 'Longitude'])
+    grid = Grid.from_points(crime_data['Longitude'], crime_data['Latitude'], resolution=GRID_RESOLUTION)
+    crime_data['LOCATION'] = grid.cell_index(crime_data['Longitude'], crime_data['Latitude'])
+    crime_counts = crime_data.groupby(['LOCATION', 'OFNS_DESC'], observed=True).size().reset_index(name='count')
+else:
+    # Borough x offense counts, rolled up from the crime count cube
+    crime_counts = load_cube('crime').rollup(['BORO_NM', 'OFNS_DESC']).reset_index(name='count')
+    crime_counts = crime_counts.rename(columns={'BORO_NM': 'LOCATION'})
+rows_out(len(crime_counts))
+
+# Bipartite offense x location graph as a sparse incidence matrix
+step("Bipartite projection", rows_in=len(crime_counts))
+incidence, crime_nodes, locations = incidence_matrix(crime_counts, 'OFNS_DESC', 'LOCATION')
+
+# Project to a unipartite crime graph (weights = number of shared locations)
+crime_graph = project(incidence)
+rows_out(crime_graph.shape[0])
 
 # Compute clustering coefficients on the projected graph
-clustering_coeffs = nx.clustering(crime_graph, weight='weight')
+step("Clustering coefficients", rows_in=crime_graph.shape[0])
+clustering_coeffs = dict(zip(crime_nodes, weighted_clustering(crime_graph).tolist()))
 
 # Compute redundancy on the projected graph
-redundancy = {}
-for node in crime_graph.nodes():
-    neighbors = list(crime_graph.neighbors(node))
-    if len(neighbors) < 2:
-        redundancy[node] = 0
-        continue
-    redundancy[node] = sum(
-        len(set(crime_graph.neighbors(neighbor)) & set(neighbors)) for neighbor in neighbors
-    ) / len(neighbors)
+step("Redundancy", rows_in=crime_graph.shape[0])
+redundancy = dict(zip(crime_nodes, node_redundancy(crime_graph).tolist()))
 
 # Sort and format clustering coefficients
 sorted_clustering = sorted(clustering_coeffs.items(), key=lambda x: x[1], reverse=True)
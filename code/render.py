@@ -0,0 +1,74 @@
+# Rasterized rendering of large point sets.
+# Instead of drawing every complaint or permit as a scatter marker, points are
+# binned into a pixel grid with NumPy and drawn as a single image layer, so the
+# cost of a map no longer grows with the number of matplotlib artists.
+
+import numpy as np
+from matplotlib.colors import to_rgb
+from matplotlib import colormaps
+from spatial import NYC_EXTENT
+
+
+class RasterCanvas:
+    """
+    Pixel grid of point counts over `extent` (lon_min, lon_max, lat_min, lat_max).
+
+    Points can be added in any number of chunks; memory stays at
+    width x height x n_labels counters. With `n_labels` the counts are kept per
+    label (e.g. cluster or dataset) so pixels can be coloured by label.
+    """
+
+    def __init__(self, extent=NYC_EXTENT, width=1000, height=1000, n_labels=1):
+        self.extent = extent
+        self.width = width
+        self.height = height
+        self.n_labels = n_labels
+        self.counts = np.zeros((height * width, n_labels), dtype='int64')
+
+    def add(self, lon, lat, labels=None):
+        """Bin a chunk of points; points outside the extent are ignored."""
+        lon = np.asarray(lon, dtype='float64')
+        lat = np.asarray(lat, dtype='float64')
+        lon_min, lon_max, lat_min, lat_max = self.extent
+        col = np.floor((lon - lon_min) / (lon_max - lon_min) * self.width)
+        row = np.floor((lat - lat_min) / (lat_max - lat_min) * self.height)
+        inside = (col >= 0) & (col < self.width) & (row >= 0) & (row < self.height)
+
+        pixel = row[inside].astype('int64') * self.width + col[inside].astype('int64')
+        if labels is None:
+            label = np.zeros(len(pixel), dtype='int64')
+        else:
+            label = np.asarray(labels, dtype='int64')[inside]
+        self.counts += np.bincount(
+            pixel * self.n_labels + label, minlength=self.counts.size
+        ).reshape(self.counts.shape)
+        return self
+
+    def _alpha(self, total):
+        # Log scaling keeps sparse areas visible next to dense hotspots
+        alpha = np.log1p(total) / np.log1p(max(total.max(), 1))
+        return np.where(total > 0, 0.25 + 0.75 * alpha, 0.0)
+
+    def shade_counts(self, cmap='Reds'):
+        """RGBA image coloured by the log point count of each pixel."""
+        total = self.counts.sum(axis=1)
+        norm = np.log1p(total) / np.log1p(max(total.max(), 1))
+        image = colormaps[cmap](norm)
+        image[:, 3] = self._alpha(total)
+        return image.reshape(self.height, self.width, 4)
+
+    def shade_labels(self, colors):
+        """
+        RGBA image where each pixel mixes the label colours by their counts,
+        with opacity from the log total count.
+        """
+        total = self.counts.sum(axis=1)
+        palette = np.array([to_rgb(colors[i % len(colors)]) for i in range(self.n_labels)])
+        rgb = self.counts @ palette / np.maximum(total, 1)[:, None]
+        image = np.column_stack([rgb, self._alpha(total)])
+        return image.reshape(self.height, self.width, 4)
+
+    def draw(self, ax, image, **kwargs):
+        """Draw an image from shade_counts/shade_labels on `ax` in lon/lat coordinates."""
+        return ax.imshow(image, extent=self.extent, origin='lower', interpolation='nearest',
+                         aspect='auto', **kwargs)
@@ -0,0 +1,99 @@
+# Spatial helpers shared by the analysis scripts.
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from profiling import profiled
+
+# Local equirectangular projection centred on NYC. Over the extent of the city
+# the distance error is well below 0.1%, which is plenty for radius queries.
+NYC_LAT0 = 40.7128
+NYC_LON0 = -74.0060
+EARTH_RADIUS_M = 6371008.8
+
+# Bounding box of the five boroughs as (lon_min, lon_max, lat_min, lat_max)
+NYC_EXTENT = (-74.26, -73.69, 40.49, 40.92)
+
+
+def to_metres(lat, lon):
+    """
+    Project latitude/longitude arrays to x/y metres around NYC.
+    Returns an (n, 2) float64 array.
+    """
+    lat = np.asarray(lat, dtype='float64')
+    lon = np.asarray(lon, dtype='float64')
+    x = np.radians(lon - NYC_LON0) * EARTH_RADIUS_M * np.cos(np.radians(NYC_LAT0))
+    y = np.radians(lat - NYC_LAT0) * EARTH_RADIUS_M
+    return np.column_stack([x, y])
+
+
+def to_days(dates):
+    """
+    Dates as integer days since the epoch, for space-time windows. Returns the
+    int64 days and a boolean mask of the missing dates (NaT).
+    """
+    dates = pd.to_datetime(dates)
+    missing = dates.isna().to_numpy().copy()
+    days = dates.to_numpy(dtype='datetime64[D]').astype('int64')
+    return days, missing
+
+
+@profiled()
+def calculate_redundancy(data, cluster_column, lat_col, lon_col, decimals=None, radius=None):
+    """
+    Calculate redundancy for each cluster based on shared spatial overlap.
+
+    By default this counts, for each cluster, the pairs of (point in the cluster,
+    point in another cluster) that share a location, divided by the size of the
+    cluster. Locations are compared exactly, or after rounding to `decimals`
+    places when given. All clusters are computed at once from the counts per
+    (location, cluster), so no pairs are ever materialised.
+
+    With `radius` (in metres) redundancy is instead the share of a cluster's
+    points that lie within `radius` of a point in another cluster, answered with
+    one KD-tree per cluster.
+
+    Points without finite coordinates overlap nothing but still count in the
+    size of their cluster.
+    """
+    clusters, labels = np.unique(data[cluster_column].to_numpy(), return_inverse=True)
+    lat = data[lat_col].to_numpy(dtype='float64')
+    lon = data[lon_col].to_numpy(dtype='float64')
+    cluster_sizes = np.bincount(labels, minlength=len(clusters))
+    located = np.isfinite(lat) & np.isfinite(lon)
+
+    if radius is not None:
+        xy = to_metres(lat, lon)
+        near_other = np.zeros(len(labels), dtype=bool)
+        for c in range(len(clusters)):
+            members = (labels == c) & located
+            if not members.any():
+                continue
+            tree = cKDTree(xy[members])
+            others = (labels != c) & located
+            distance, _ = tree.query(xy[others], k=1, distance_upper_bound=radius, workers=-1)
+            near_other[others] |= distance <= radius
+        overlap = np.bincount(labels, weights=near_other, minlength=len(clusters))
+    else:
+        lat, lon, labels = lat[located], lon[located], labels[located]
+        if decimals is not None:
+            lat = np.round(lat, decimals)
+            lon = np.round(lon, decimals)
+        # One hashing pass: id every distinct location, then count points per (location, cluster)
+        lat_codes, lat_uniques = pd.factorize(lat)
+        lon_codes = pd.factorize(lon)[0]
+        location = pd.factorize(lon_codes.astype('int64') * len(lat_uniques) + lat_codes)[0]
+        pair_codes, pair_keys = pd.factorize(location * len(clusters) + labels)
+        pair_counts = np.bincount(pair_codes)
+        pair_location = pair_keys // len(clusters)
+        pair_cluster = pair_keys % len(clusters)
+        location_totals = np.bincount(location)
+        # Each point of cluster c at a location overlaps every other-cluster point there
+        overlap = np.bincount(
+            pair_cluster,
+            weights=pair_counts * (location_totals[pair_location] - pair_counts),
+            minlength=len(clusters)
+        )
+
+    scores = np.divide(overlap, cluster_sizes, out=np.zeros(len(clusters)), where=cluster_sizes > 0)
+    return {cluster: float(score) for cluster, score in zip(clusters, scores)}
@@ -0,0 +1,94 @@
+# Spatio-temporal join between permits and crimes.
+# For every permit, count the crimes within R metres and within +/- T days of
+# its date, per offense level. Crimes are split into time buckets as wide as the
+# largest window; each bucket is paired only with the permits whose windows can
+# reach it, using KD-trees on projected coordinates, so there is no cross join.
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from spatial import to_days, to_metres
+from profiling import profiled
+
+
+@profiled()
+def crimes_near_permits(permits, crimes, radii=(100, 250, 500), windows=(7, 30, 90),
+                        permit_date_col='Filing Date', permit_lat_col='LATITUDE', permit_lon_col='LONGITUDE',
+                        crime_date_col='CMPLNT_FR_DT', crime_lat_col='Latitude', crime_lon_col='Longitude',
+                        category_col='LAW_CAT_CD'):
+    """
+    Count, for every permit, the crimes within each radius (metres) and each
+    +/- window (days) of the permit date, per `category_col` value and in total.
+
+    Returns a frame aligned with `permits` with one column per combination,
+    named like 'FELONY_250m_30d' and 'ALL_250m_30d'. Permits without a date or
+    coordinates get missing values.
+    """
+    radii = sorted(radii)
+    windows = sorted(windows)
+    max_radius, max_window = radii[-1], windows[-1]
+
+    p_days, p_missing = to_days(permits[permit_date_col])
+    p_missing |= permits[[permit_lat_col, permit_lon_col]].isna().any(axis=1).to_numpy()
+    p_index = np.flatnonzero(~p_missing)
+    p_xy = to_metres(permits[permit_lat_col].to_numpy()[p_index], permits[permit_lon_col].to_numpy()[p_index])
+    p_days = p_days[p_index]
+
+    c_days, c_missing = to_days(crimes[crime_date_col])
+    c_missing |= crimes[[crime_lat_col, crime_lon_col]].isna().any(axis=1).to_numpy()
+    c_keep = np.flatnonzero(~c_missing)
+    c_category, categories = pd.factorize(crimes[category_col].astype(object).fillna('UNKNOWN').to_numpy()[c_keep])
+    c_xy = to_metres(crimes[crime_lat_col].to_numpy()[c_keep], crimes[crime_lon_col].to_numpy()[c_keep])
+    c_days = c_days[c_keep]
+
+    # Sort both sides by time so buckets and reachable permits are contiguous slices
+    c_order = np.argsort(c_days, kind='stable')
+    c_xy, c_days, c_category = c_xy[c_order], c_days[c_order], c_category[c_order]
+    p_order = np.argsort(p_days, kind='stable')
+    p_sorted_days = p_days[p_order]
+
+    n_permits, n_categories = len(p_index), len(categories)
+    counts = np.zeros((len(radii), len(windows), n_permits * n_categories), dtype='int64')
+
+    if len(c_days) and n_permits:
+        bucket_width = max(max_window, 1)
+        for bucket_start in range(int(c_days[0]), int(c_days[-1]) + 1, bucket_width):
+            c_lo, c_hi = np.searchsorted(c_days, [bucket_start, bucket_start + bucket_width])
+            if c_lo == c_hi:
+                continue
+            p_lo, p_hi = np.searchsorted(p_sorted_days, [bucket_start - max_window,
+                                                         bucket_start + bucket_width + max_window])
+            if p_lo == p_hi:
+                continue
+            permit_ids = p_order[p_lo:p_hi]
+
+            pairs = cKDTree(p_xy[permit_ids]).sparse_distance_matrix(
+                cKDTree(c_xy[c_lo:c_hi]), max_radius, output_type='ndarray'
+            )
+            if not len(pairs):
+                continue
+            permit = permit_ids[pairs['i']]
+            crime = c_lo + pairs['j']
+            gap = np.abs(p_days[permit] - c_days[crime])
+            key = permit * n_categories + c_category[crime]
+            for ri, radius in enumerate(radii):
+                within_radius = pairs['v'] <= radius
+                for wi, window in enumerate(windows):
+                    selected = within_radius & (gap <= window)
+                    counts[ri, wi] += np.bincount(key[selected], minlength=n_permits * n_categories)
+
+    result = pd.DataFrame(index=permits.index)
+    for ri, radius in enumerate(radii):
+        for wi, window in enumerate(windows):
+            per_category = counts[ri, wi].reshape(n_permits, n_categories)
+            for ci, category in enumerate(categories):
+                result[f'{category}_{radius}m_{window}d'] = _align(per_category[:, ci], p_index, len(permits))
+            result[f'ALL_{radius}m_{window}d'] = _align(per_category.sum(axis=1), p_index, len(permits))
+    return result
+
+
+def _align(values, index, n):
+    column = pd.array(np.zeros(n, dtype='int64'), dtype='Int64')
+    column[:] = pd.NA
+    column[index] = values
+    return column
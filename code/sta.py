@@ -4,37 +4,34 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy.stats import spearmanr, pearsonr
-
-# Load datasets
-crime_data = pd.read_csv('../../Documents/GitHub/urban/sampled_crime_data.csv')
-urban_data = pd.read_csv('../../Documents/GitHub/urban/filtered_urban_data.csv')
-
-# Step 1: Preprocessing the Urban Dataset
-# Convert 'Filing Date' to datetime
-urban_data['Filing Date'] = pd.to_datetime(urban_data['Filing Date'], errors='coerce')
-
-# Extract month and year for temporal analysis
-urban_data['Year'] = urban_data['Filing Date'].dt.year
-urban_data['Month'] = urban_data['Filing Date'].dt.month
-
-# Group by borough and time (monthly and yearly)
-urban_monthly = urban_data.groupby(['BOROUGH', 'Year', 'Month']).size().reset_index(name='Urban_Project_Count')
-urban_yearly = urban_data.groupby(['BOROUGH', 'Year']).size().reset_index(name='Urban_Project_Count')
-
-# Step 2: Preprocessing the Crime Dataset
-# Convert 'CMPLNT_FR_DT' to datetime
-crime_data['CMPLNT_FR_DT'] = pd.to_datetime(crime_data['CMPLNT_FR_DT'], errors='coerce')
-
-# Extract month and year for temporal analysis
-crime_data['Year'] = crime_data['CMPLNT_FR_DT'].dt.year
-crime_data['Month'] = crime_data['CMPLNT_FR_DT'].dt.month
-
-# Group by borough and time (monthly and yearly)
-crime_monthly = crime_data.groupby(['BORO_NM', 'Year', 'Month']).size().reset_index(name='Crime_Count')
-crime_yearly = crime_data.groupby(['BORO_NM', 'Year']).size().reset_index(name='Crime_Count')
+from store import load_dataset
+from st_join import crimes_near_permits
+from correlation import correlation_significance, lagged_correlation, monthly_counts, row_correlation
+from cube import load_cube
+from profiling import rows_out, step
+from figures import figure, render_figures
+from zones import load_layer, zone_column
+from activity import ActivePermits
+
+step("Load count cubes")
+# Borough x year x month counts are rolled up from the materialized count cubes (see cube.py)
+crime_cube = load_cube('crime')
+urban_cube = load_cube('urban')
+
+# Step 1: Urban project counts by borough and time (monthly and yearly)
+step("Step 1: Urban project counts")
+urban_monthly = urban_cube.rollup(['BOROUGH', 'Year', 'Month']).reset_index(name='Urban_Project_Count')
+urban_yearly = urban_cube.rollup(['BOROUGH', 'Year']).reset_index(name='Urban_Project_Count')
+rows_out(len(urban_monthly))
+
+# Step 2: Crime counts by borough and time (monthly and yearly)
+step("Step 2: Crime counts")
+crime_monthly = crime_cube.rollup(['BORO_NM', 'Year', 'Month']).reset_index(name='Crime_Count')
+crime_yearly = crime_cube.rollup(['BORO_NM', 'Year']).reset_index(name='Crime_Count')
+rows_out(len(crime_monthly))
 
 # Step 3: Merge Both Datasets
+step("Step 3: Merge both datasets", rows_in=len(urban_monthly) + len(crime_monthly))
 # Monthly Merge
 merged_monthly = pd.merge(urban_monthly, crime_monthly,
                           left_on=['BOROUGH', 'Year', 'Month'],
@@ -46,26 +43,32 @@ merged_yearly = pd.merge(urban_yearly, crime_yearly,
                          left_on=['BOROUGH', 'Year'],
                          right_on=['BORO_NM', 'Year'],
                          how='inner').drop(columns='BORO_NM')
+rows_out(len(merged_monthly))
 
 # Step 4: Correlation Analysis
+def period_matrices(data):
+    """
+    Borough x period matrices of urban project and crime counts (NaN where a
+    period is missing from the merged data).
+    """
+    period = ['Year', 'Month'] if 'Month' in data.columns else ['Year']
+    urban_matrix = data.pivot_table(index='BOROUGH', columns=period, values='Urban_Project_Count')
+    crime_matrix = data.pivot_table(index='BOROUGH', columns=period, values='Crime_Count')
+    return urban_matrix, crime_matrix
+
+
 def compute_correlation(data, method='pearson'):
     """
     Computes correlation between urban project counts and crime counts.
+    All boroughs are correlated at once from borough x period count matrices.
     """
-    correlation_results = {}
-    for borough in data['BOROUGH'].unique():
-        borough_data = data[data['BOROUGH'] == borough]
-        if len(borough_data) > 1:
-            if method == 'pearson':
-                corr, _ = pearsonr(borough_data['Urban_Project_Count'], borough_data['Crime_Count'])
-            elif method == 'spearman':
-                corr, _ = spearmanr(borough_data['Urban_Project_Count'], borough_data['Crime_Count'])
-            else:
-                raise ValueError("Unsupported method")
-            correlation_results[borough] = corr
-    return correlation_results
+    urban_matrix, crime_matrix = period_matrices(data)
+    corr = row_correlation(urban_matrix.to_numpy(), crime_matrix.to_numpy(), method)
+    n_periods = urban_matrix.notna().sum(axis=1).to_numpy()
+    return {borough: c for borough, c, n in zip(urban_matrix.index, corr, n_periods) if n > 1}
 
 # Compute Pearson and Spearman correlations for monthly data
+step("Step 4: Correlation analysis", rows_in=len(merged_monthly))
 monthly_pearson_corr = compute_correlation(merged_monthly, method='pearson')
 monthly_spearman_corr = compute_correlation(merged_monthly, method='spearman')
 
@@ -73,24 +76,102 @@ monthly_spearman_corr = compute_correlation(merged_monthly, method='spearman')
 yearly_pearson_corr = compute_correlation(merged_yearly, method='pearson')
 yearly_spearman_corr = compute_correlation(merged_yearly, method='spearman')
 
-# Step 5: Visualization
+# Significance from resampling instead of parametric p-values (only 4 yearly points
+# per borough): block-bootstrap confidence intervals and permutation p-values,
+# reproducible from SEED. Monthly series are resampled in 3-month blocks.
+step("Step 4: Correlation significance", rows_in=len(merged_monthly))
+N_RESAMPLES = 10000
+SEED = 42
+significance = {
+    (scale, method): correlation_significance(*period_matrices(data), method=method, n_resamples=N_RESAMPLES,
+                                              block_length=block_length, seed=SEED)
+    for scale, data, block_length in [('Monthly', merged_monthly, 3), ('Yearly', merged_yearly, 1)]
+    for method in ('pearson', 'spearman')
+}
+
+# Lagged correlation surface: permits leading crime by 0-24 months, every borough at once
+step("Step 4: Lagged correlation")
+MAX_LAG = 24  # months
+urban_by_month = urban_cube.monthly_matrix('BOROUGH')
+crime_by_month = crime_cube.monthly_matrix('BORO_NM')
+lagged_corr = lagged_correlation(urban_by_month, crime_by_month, lags=range(0, MAX_LAG + 1))
+
+# Step 5: Crimes around each permit
+# Count the crimes within R metres and +/- T days of every permit's filing date,
+# per offense level, and summarise the averages per borough
+step("Step 5: Crimes around each permit")
+PERMIT_RADII = (100, 250, 500)  # metres
+PERMIT_WINDOWS = (7, 30, 90)  # days
+permit_points = load_dataset('urban', columns=['BOROUGH', 'LATITUDE', 'LONGITUDE', 'Filing Date', 'Issuance Date',
+                                               'Expiration Date'])
+crime_points = load_dataset('crime', columns=['Latitude', 'Longitude', 'CMPLNT_FR_DT', 'LAW_CAT_CD'])
+crimes_near = crimes_near_permits(permit_points, crime_points, radii=PERMIT_RADII, windows=PERMIT_WINDOWS,
+                                  permit_date_col='Filing Date')
+rows_out(len(crimes_near))
+all_columns = [c for c in crimes_near.columns if c.startswith('ALL_')]
+crimes_near_by_borough = (crimes_near[all_columns].astype('float64')
+                          .groupby(permit_points['BOROUGH'], observed=True).mean())
+
+# Step 6: Permits under way
+# Filing counts ignore how long construction lasts; here the monthly crime counts are
+# correlated with the average number of permits active (issued and not yet expired)
+# per day in each borough
+step("Step 6: Permits under way", rows_in=len(permit_points))
+
+
+def group_correlation(permits, crimes):
+    """Pearson and Spearman correlation of every group (row) present in both group x month matrices."""
+    permits, crimes = permits.align(crimes, join='inner', axis=0)
+    return pd.DataFrame({
+        method: row_correlation(permits.to_numpy(dtype='float64'), crimes.to_numpy(dtype='float64'), method)
+        for method in ('pearson', 'spearman')
+    }, index=permits.index)
+
+
+active_by_month = ActivePermits.from_frame(permit_points).monthly()
+active_corr = group_correlation(active_by_month, crime_by_month).rename_axis('BOROUGH')
+rows_out(len(active_corr))
+
+# Step 7: Correlation per zone
+# With a polygon layer (police precincts, NTAs, census tracts, ...) permits and crimes
+# are tagged with the zone they fall in (see zones.py) and the monthly correlation is
+# computed for every zone instead of every borough
+ZONE_LAYER = None  # e.g. '../data/nyc_precincts.geojson'
+ZONE_ID = 'precinct'
+if ZONE_LAYER:
+    step("Step 7: Correlation per zone", rows_in=len(permit_points) + len(crime_points))
+    zones = load_layer(ZONE_LAYER, ZONE_ID)
+    permit_points['ZONE'] = zone_column(permit_points, 'urban', zones, ZONE_ID)
+    crime_points['ZONE'] = zone_column(crime_points, 'crime', zones, ZONE_ID)
+    urban_by_zone = monthly_counts(permit_points.dropna(subset=['ZONE']), 'ZONE', 'Filing Date')
+    crime_by_zone = monthly_counts(crime_points.dropna(subset=['ZONE']), 'ZONE', 'CMPLNT_FR_DT')
+    zone_corr = group_correlation(urban_by_zone, crime_by_zone).rename_axis(ZONE_ID)
+    active_zone_corr = group_correlation(ActivePermits.from_frame(permit_points, zone_col='ZONE').monthly(),
+                                         crime_by_zone).rename_axis(ZONE_ID)
+    rows_out(len(zone_corr))
+
+# Step 8: Visualization
+step("Step 8: Visualization")
 
 # Plot monthly trends for a sample borough (e.g., Manhattan)
 borough_example = 'MANHATTAN'
 manhattan_data = merged_monthly[merged_monthly['BOROUGH'] == borough_example]
 
-plt.figure(figsize=(12, 6))
-plt.plot(manhattan_data['Year'].astype(str) + '-' + manhattan_data['Month'].astype(str),
-         manhattan_data['Urban_Project_Count'], label='Urban Project Count', marker='o')
-plt.plot(manhattan_data['Year'].astype(str) + '-' + manhattan_data['Month'].astype(str),
-         manhattan_data['Crime_Count'], label='Crime Count', marker='x')
-plt.xticks(rotation=45)
-plt.title(f"Urban Development vs Crime in {borough_example} (Monthly)")
-plt.xlabel("Time (Year-Month)")
-plt.ylabel("Counts")
-plt.legend()
-plt.tight_layout()
-plt.show()
+
+@figure('monthly_trends_manhattan')
+def plot_monthly_trends():
+    plt.figure(figsize=(12, 6))
+    plt.plot(manhattan_data['Year'].astype(str) + '-' + manhattan_data['Month'].astype(str),
+             manhattan_data['Urban_Project_Count'], label='Urban Project Count', marker='o')
+    plt.plot(manhattan_data['Year'].astype(str) + '-' + manhattan_data['Month'].astype(str),
+             manhattan_data['Crime_Count'], label='Crime Count', marker='x')
+    plt.xticks(rotation=45)
+    plt.title(f"Urban Development vs Crime in {borough_example} (Monthly)")
+    plt.xlabel("Time (Year-Month)")
+    plt.ylabel("Counts")
+    plt.legend()
+    plt.tight_layout()
+
 
 # Heatmap for yearly correlations across boroughs
 corr_df = pd.DataFrame({
@@ -100,13 +181,48 @@ corr_df = pd.DataFrame({
 })
 corr_df = corr_df.set_index('Borough')
 
-plt.figure(figsize=(8, 6))
-sns.heatmap(corr_df, annot=True, cmap='coolwarm', fmt=".2f")
-plt.title("Correlation Between Urban Development and Crime Counts (Yearly)")
-plt.show()
+
+@figure('yearly_correlation_heatmap')
+def plot_yearly_correlations():
+    plt.figure(figsize=(8, 6))
+    sns.heatmap(corr_df, annot=True, cmap='coolwarm', fmt=".2f")
+    plt.title("Correlation Between Urban Development and Crime Counts (Yearly)")
+
+
+# Heatmap of the lagged monthly correlations (permits leading crime)
+@figure('lagged_correlation_heatmap')
+def plot_lagged_correlations():
+    plt.figure(figsize=(14, 5))
+    sns.heatmap(lagged_corr['pearson'], cmap='coolwarm', center=0, vmin=-1, vmax=1)
+    plt.title("Pearson Correlation of Monthly Permits with Crime Counts Lagged by k Months")
+    plt.xlabel("Lag (months)")
+    plt.ylabel("Borough")
+    plt.tight_layout()
+
+
+render_figures()
 
 # Print Results
 print("Monthly Pearson Correlation:", monthly_pearson_corr)
 print("Monthly Spearman Correlation:", monthly_spearman_corr)
 print("\nYearly Pearson Correlation:", yearly_pearson_corr)
-print("Yearly Spearman Correlation:", yearly_spearman_corr)
\ No newline at end of file
+print("Yearly Spearman Correlation:", yearly_spearman_corr)
+
+for (scale, method), table in significance.items():
+    print(f"\n{scale} {method.capitalize()} Correlation Significance ({N_RESAMPLES} resamples):")
+    print(table.round(4))
+
+print("\nAverage crimes near each permit by borough:")
+print(crimes_near_by_borough.round(2))
+
+print("\nAverage permits under way per day (yearly mean of the monthly averages):")
+print(active_by_month.T.groupby(active_by_month.columns.year).mean().T.round(1))
+print("\nMonthly correlation between permits under way and crime counts:")
+print(active_corr.round(3))
+
+if ZONE_LAYER:
+    print(f"\nMonthly correlation per {ZONE_ID} ({len(zone_corr)} zones with permits and crimes):")
+    print(zone_corr.describe().round(3))
+    print(zone_corr.sort_values('pearson', ascending=False).head(10).round(3))
+    print(f"\nMonthly correlation per {ZONE_ID}, permits under way:")
+    print(active_zone_corr.describe().round(3))
@@ -0,0 +1,190 @@
+# Deterministic synthetic NYC complaint and permit data for benchmarking.
+# Rows follow the schemas of the raw complaint extract (Book1.csv) and of
+# filtered_urban_data.csv, with borough, offense and premises mixes close to the
+# real data, points around borough centres and fixed hotspots inside the NYC
+# bounding box, and seasonal 2016-2019 dates. Rows are generated in chunks, each
+# from its own child of the seed, so any size can be written with bounded memory
+# and the same (n, chunk_size, seed) always gives the same file.
+
+import numpy as np
+import pandas as pd
+from spatial import NYC_EXTENT
+
+START, END = '2016-01-01', '2019-12-31'
+
+# Centre (lat, lon) and spread (degrees) of each borough
+BOROUGHS = {
+    'MANHATTAN': ((40.78, -73.97), (0.040, 0.020)),
+    'BROOKLYN': ((40.65, -73.95), (0.040, 0.050)),
+    'BRONX': ((40.84, -73.88), (0.030, 0.040)),
+    'QUEENS': ((40.72, -73.82), (0.050, 0.070)),
+    'STATEN ISLAND': ((40.58, -74.15), (0.040, 0.050)),
+}
+CRIME_BOROUGH_MIX = {'BROOKLYN': 0.30, 'MANHATTAN': 0.25, 'BRONX': 0.20, 'QUEENS': 0.20, 'STATEN ISLAND': 0.05}
+PERMIT_BOROUGH_MIX = {'MANHATTAN': 0.38, 'BROOKLYN': 0.28, 'QUEENS': 0.22, 'BRONX': 0.08, 'STATEN ISLAND': 0.04}
+PATROL_BOROS = {
+    'MANHATTAN': ['PATROL BORO MAN NORTH', 'PATROL BORO MAN SOUTH'],
+    'BROOKLYN': ['PATROL BORO BKLYN NORTH', 'PATROL BORO BKLYN SOUTH'],
+    'BRONX': ['PATROL BORO BRONX'],
+    'QUEENS': ['PATROL BORO QUEENS NORTH', 'PATROL BORO QUEENS SOUTH'],
+    'STATEN ISLAND': ['PATROL BORO STATEN ISLAND'],
+}
+
+# Offense: (share, law category)
+OFFENSES = {
+    'PETIT LARCENY': (0.200, 'MISDEMEANOR'),
+    'HARRASSMENT 2': (0.150, 'VIOLATION'),
+    'ASSAULT 3 & RELATED OFFENSES': (0.120, 'MISDEMEANOR'),
+    'CRIMINAL MISCHIEF & RELATED OF': (0.100, 'MISDEMEANOR'),
+    'GRAND LARCENY': (0.100, 'FELONY'),
+    'FELONY ASSAULT': (0.050, 'FELONY'),
+    'ROBBERY': (0.040, 'FELONY'),
+    'BURGLARY': (0.040, 'FELONY'),
+    'DANGEROUS DRUGS': (0.040, 'MISDEMEANOR'),
+    'OFF. AGNST PUB ORD SENSBLTY &': (0.040, 'MISDEMEANOR'),
+    'MISCELLANEOUS PENAL LAW': (0.030, 'FELONY'),
+    'THEFT-FRAUD': (0.030, 'MISDEMEANOR'),
+    'VEHICLE AND TRAFFIC LAWS': (0.020, 'MISDEMEANOR'),
+    'SEX CRIMES': (0.015, 'MISDEMEANOR'),
+    'GRAND LARCENY OF MOTOR VEHICLE': (0.015, 'FELONY'),
+    'DANGEROUS WEAPONS': (0.015, 'MISDEMEANOR'),
+    'INTOXICATED & IMPAIRED DRIVING': (0.010, 'MISDEMEANOR'),
+    'FORGERY': (0.010, 'FELONY'),
+    'CRIMINAL TRESPASS': (0.010, 'MISDEMEANOR'),
+    'OFFENSES AGAINST PUBLIC ADMINI': (0.005, 'MISDEMEANOR'),
+}
+PREMISES = {
+    'STREET': 0.32, 'RESIDENCE - APT. HOUSE': 0.22, 'RESIDENCE-HOUSE': 0.09, 'RESIDENCE - PUBLIC HOUSING': 0.08,
+    'OTHER': 0.05, 'CHAIN STORE': 0.03, 'COMMERCIAL BUILDING': 0.03, 'DEPARTMENT STORE': 0.03,
+    'TRANSIT - NYC SUBWAY': 0.02, 'GROCERY/BODEGA': 0.02, 'RESTAURANT/DINER': 0.02, 'PARK/PLAYGROUND': 0.01,
+    'DRUG STORE': 0.01, 'BAR/NIGHT CLUB': 0.01, None: 0.05,
+}
+VIC_AGE_GROUPS = {'25-44': 0.42, '45-64': 0.22, 'UNKNOWN': 0.17, '18-24': 0.11, '<18': 0.04, '65+': 0.04}
+VIC_RACES = {'BLACK': 0.30, 'WHITE HISPANIC': 0.22, 'UNKNOWN': 0.17, 'WHITE': 0.14, 'ASIAN / PACIFIC ISLANDER': 0.08,
+             'BLACK HISPANIC': 0.08, 'AMERICAN INDIAN/ALASKAN NATIVE': 0.01}
+VIC_SEXES = {'F': 0.43, 'M': 0.38, 'E': 0.12, 'D': 0.07}
+
+JOB_TYPES = {'A2': 0.712, 'NB': 0.112, 'A1': 0.100, 'A3': 0.056, 'DM': 0.019, 'SG': 0.001}
+PERMIT_STATUSES = {'ISSUED': 0.988, 'RE-ISSUED': 0.009, 'IN PROCESS': 0.002, None: 0.001}
+SITE_FILLS = {'NOT APPLICABLE': 0.674, None: 0.161, 'USE UNDER 300 CU.YD': 0.076, 'ON-SITE': 0.067,
+              'OFF-SITE': 0.013, 'NONE': 0.009}
+
+CRIME_COLUMNS = ['BORO_NM', 'Latitude', 'Longitude', 'LAW_CAT_CD', 'OFNS_DESC', 'CMPLNT_FR_DT', 'PREM_TYP_DESC',
+                 'PATROL_BORO', 'VIC_AGE_GROUP', 'VIC_RACE', 'VIC_SEX']
+PERMIT_COLUMNS = ['BOROUGH', 'LATITUDE', 'LONGITUDE', 'Filing Date', 'Issuance Date', 'Expiration Date',
+                  'Permit Status', 'Job Type', 'Residential', 'Non-Profit', "Owner's Business Name", 'Site Fill',
+                  'Street Name']
+DATE_FORMATS = {'crime': '%m/%d/%Y', 'urban': '%Y-%m-%d'}
+
+N_HOTSPOTS = 8  # per borough
+HOTSPOT_SHARE = 0.3
+HOTSPOT_SPREAD = 0.004  # degrees
+MISSING_COORDINATES = 0.002
+
+
+def _choice(rng, mix, size):
+    values = list(mix)
+    p = np.array(list(mix.values()), dtype='float64')
+    return np.array(values, dtype=object)[rng.choice(len(values), size=size, p=p / p.sum())]
+
+
+def _hotspots():
+    """Fixed hotspot centres per borough (the same for every seed, like real hotspots)."""
+    rng = np.random.default_rng(2016)
+    return {
+        borough: rng.normal(centre, spread, size=(N_HOTSPOTS, 2))
+        for borough, (centre, spread) in BOROUGHS.items()
+    }
+
+
+def _locations(rng, boroughs):
+    """Points around each borough's centre, a share of them around its hotspots, clipped to NYC."""
+    hotspots = _hotspots()
+    lat = np.empty(len(boroughs))
+    lon = np.empty(len(boroughs))
+    for borough, ((lat_c, lon_c), (lat_s, lon_s)) in BOROUGHS.items():
+        rows = np.flatnonzero(boroughs == borough)
+        lat[rows] = rng.normal(lat_c, lat_s, len(rows))
+        lon[rows] = rng.normal(lon_c, lon_s, len(rows))
+        hot = rows[rng.random(len(rows)) < HOTSPOT_SHARE]
+        centre = hotspots[borough][rng.integers(0, N_HOTSPOTS, len(hot))]
+        lat[hot] = rng.normal(centre[:, 0], HOTSPOT_SPREAD)
+        lon[hot] = rng.normal(centre[:, 1], HOTSPOT_SPREAD)
+    lon_min, lon_max, lat_min, lat_max = NYC_EXTENT
+    lat = np.clip(lat, lat_min, lat_max)
+    lon = np.clip(lon, lon_min, lon_max)
+    missing = rng.random(len(boroughs)) < MISSING_COORDINATES
+    lat[missing] = np.nan
+    lon[missing] = np.nan
+    return lat, lon
+
+
+def _dates(rng, size, start=START, end=END, out_of_window=0.0):
+    """Seasonal daily dates (summer peak); `out_of_window` of them fall in the six years before `start`."""
+    days = pd.date_range(start, end, freq='D')
+    weight = 1 + 0.15 * np.sin(2 * np.pi * (days.dayofyear.to_numpy() - 100) / 365.25)
+    dates = days.to_numpy()[rng.choice(len(days), size=size, p=weight / weight.sum())]
+    early = rng.random(size) < out_of_window
+    earlier = pd.date_range(pd.Timestamp(start) - pd.DateOffset(years=6), pd.Timestamp(start) - pd.Timedelta(days=1))
+    dates[early] = earlier[rng.integers(0, len(earlier), early.sum())].to_numpy()
+    return dates
+
+
+def generate_crimes(n, rng, out_of_window=0.0):
+    """`n` synthetic complaints with the columns of the raw complaint extract (dates parsed)."""
+    boroughs = _choice(rng, CRIME_BOROUGH_MIX, n)
+    lat, lon = _locations(rng, boroughs)
+    offenses = _choice(rng, {offense: share for offense, (share, _) in OFFENSES.items()}, n)
+    law_categories = pd.Series(offenses).map({offense: law for offense, (_, law) in OFFENSES.items()}).to_numpy()
+    patrol = np.empty(n, dtype=object)
+    for borough, patrol_boros in PATROL_BOROS.items():
+        rows = np.flatnonzero(boroughs == borough)
+        patrol[rows] = np.array(patrol_boros, dtype=object)[rng.integers(0, len(patrol_boros), len(rows))]
+    return pd.DataFrame({
+        'BORO_NM': boroughs, 'Latitude': lat, 'Longitude': lon,
+        'LAW_CAT_CD': law_categories, 'OFNS_DESC': offenses,
+        'CMPLNT_FR_DT': _dates(rng, n, out_of_window=out_of_window),
+        'PREM_TYP_DESC': _choice(rng, PREMISES, n), 'PATROL_BORO': patrol,
+        'VIC_AGE_GROUP': _choice(rng, VIC_AGE_GROUPS, n), 'VIC_RACE': _choice(rng, VIC_RACES, n),
+        'VIC_SEX': _choice(rng, VIC_SEXES, n),
+    }, columns=CRIME_COLUMNS)
+
+
+def generate_permits(n, rng, out_of_window=0.0):
+    """`n` synthetic permits with the columns of filtered_urban_data.csv (dates parsed)."""
+    boroughs = _choice(rng, PERMIT_BOROUGH_MIX, n)
+    lat, lon = _locations(rng, boroughs)
+    filing = _dates(rng, n, out_of_window=out_of_window)
+    issuance = filing + rng.geometric(0.3, n).astype('timedelta64[D]') - np.timedelta64(1, 'D')
+    expiration = issuance + rng.integers(90, 366, n).astype('timedelta64[D]')
+    # Owners and streets are drawn from long-tailed pools, like the real registers
+    owners = np.array([f'OWNER {i} LLC' for i in range(5000)], dtype=object)
+    streets = np.array([f'{i} STREET' for i in range(1, 2001)], dtype=object)
+    return pd.DataFrame({
+        'BOROUGH': boroughs, 'LATITUDE': lat, 'LONGITUDE': lon,
+        'Filing Date': filing, 'Issuance Date': issuance, 'Expiration Date': expiration,
+        'Permit Status': _choice(rng, PERMIT_STATUSES, n), 'Job Type': _choice(rng, JOB_TYPES, n),
+        'Residential': _choice(rng, {'YES': 0.572, None: 0.428}, n),
+        'Non-Profit': _choice(rng, {'N': 0.95, 'Y': 0.049, None: 0.001}, n),
+        "Owner's Business Name": owners[np.minimum(rng.zipf(1.5, n) - 1, len(owners) - 1)],
+        'Site Fill': _choice(rng, SITE_FILLS, n),
+        'Street Name': streets[np.minimum(rng.zipf(1.3, n) - 1, len(streets) - 1)],
+    }, columns=PERMIT_COLUMNS)
+
+
+GENERATORS = {'crime': generate_crimes, 'urban': generate_permits}
+
+
+def iter_synthetic(dataset, n, chunk_size=1000000, seed=42, out_of_window=0.0):
+    """Yield `n` synthetic rows of `dataset` ('crime' or 'urban') in chunks of `chunk_size`."""
+    sizes = [chunk_size] * (n // chunk_size) + ([n % chunk_size] if n % chunk_size else [])
+    for size, chunk_seed in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))):
+        yield GENERATORS[dataset](size, np.random.default_rng(chunk_seed), out_of_window=out_of_window)
+
+
+def write_synthetic_csv(dataset, n, path, chunk_size=1000000, seed=42, out_of_window=0.0):
+    """Write `n` synthetic rows of `dataset` to a CSV with the raw file's date format; returns `path`."""
+    for i, chunk in enumerate(iter_synthetic(dataset, n, chunk_size, seed, out_of_window)):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False,
+                     date_format=DATE_FORMATS[dataset])
+    return path
@@ -0,0 +1,281 @@
+# Classifier training harness for modeling.py.
+# The features are encoded once into a sparse design matrix (one-hot categorical
+# columns followed by the numeric ones), cached on disk under a hash of the input
+# rows, and every classifier is fitted concurrently in a process pool on the same
+# train/test split, with its fit/predict wall time and peak memory recorded.
+# For data that does not fit in memory, features are hashed into a fixed number
+# of columns chunk by chunk and incremental models are trained with partial_fit.
+
+import hashlib
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+from sklearn.model_selection import train_test_split
+from sklearn.utils import murmurhash3_32
+from parallel import process_pool, shared_array
+from store import DATA_DIR
+from profiling import profiled, rss, reset_peak_rss
+
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+
+
+def fill_category(values, fill):
+    """Fill the missing values of a (possibly categorical) Series with `fill`."""
+    if isinstance(values.dtype, pd.CategoricalDtype) and fill not in values.cat.categories:
+        values = values.cat.add_categories([fill])
+    return values.fillna(fill)
+
+
+def collapse_rare(values, threshold, other='OTHER'):
+    """Replace the values seen `threshold` times or fewer with `other`."""
+    counts = values.value_counts()
+    keep = values.isin(counts.index[counts > threshold])
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Only the categories are rewritten; the rows keep their integer codes
+        if other not in values.cat.categories:
+            values = values.cat.add_categories([other])
+        return values.where(keep, other).cat.remove_unused_categories()
+    return values.where(keep, other)
+
+
+def _cache_key(frame, categorical, numeric):
+    digest = hashlib.sha1(repr((list(categorical), list(numeric))).encode())
+    digest.update(pd.util.hash_pandas_object(frame[list(categorical) + list(numeric)], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _encode(frame, categorical, numeric):
+    blocks, names = [], []
+    for column in categorical:
+        values = frame[column]
+        # Missing categories take the most frequent value, as SimpleImputer(strategy='most_frequent')
+        if values.isna().any() and values.notna().any():
+            values = values.fillna(values.mode().iloc[0])
+        codes, categories = pd.factorize(values, sort=True)
+        blocks.append(sparse.csr_matrix((np.ones(len(codes)), (np.arange(len(codes)), codes)),
+                                        shape=(len(codes), len(categories))))
+        names += [f'{column}_{category}' for category in categories]
+    numeric_values = frame[list(numeric)].astype('float64').fillna(0).to_numpy()
+    blocks.append(sparse.csr_matrix(numeric_values))
+    names += list(numeric)
+    return sparse.hstack(blocks, format='csr'), np.array(names, dtype=str)
+
+
+@profiled()
+def design_matrix(frame, categorical, numeric, cache=True):
+    """
+    Sparse design matrix of `frame`: one-hot encoded `categorical` columns
+    (categories sorted, missing values imputed with the most frequent one)
+    followed by the `numeric` columns (missing -> 0). Returns (X, feature_names).
+    The result is cached in data/cache, keyed on the content of the input columns.
+    """
+    path = os.path.join(CACHE_DIR, f'design_{_cache_key(frame, categorical, numeric)}.npz')
+    if cache and os.path.exists(path):
+        with np.load(path) as cached:
+            X = sparse.csr_matrix((cached['data'], cached['indices'], cached['indptr']), shape=cached['shape'])
+            return X, cached['feature_names']
+
+    X, feature_names = _encode(frame, categorical, numeric)
+    if cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        np.savez(path, data=X.data, indices=X.indices, indptr=X.indptr, shape=X.shape, feature_names=feature_names)
+    return X, feature_names
+
+
+def standardize_columns(X, columns):
+    """Copy of `X` with the given (dense, numeric) columns scaled to zero mean and unit variance."""
+    X = sparse.csc_matrix(X)
+    columns = np.asarray(columns)
+    others = np.setdiff1d(np.arange(X.shape[1]), columns)
+    values = X[:, columns].toarray()
+    std = values.std(axis=0)
+    scaled = (values - values.mean(axis=0)) / np.where(std > 0, std, 1.0)
+    # Put the scaled columns back in their original positions
+    order = np.argsort(np.concatenate([others, columns]))
+    return sparse.hstack([X[:, others], sparse.csc_matrix(scaled)], format='csc')[:, order].tocsr()
+
+
+def _fit_classifier(name, clf, variant):
+    try:
+        X = shared_array(variant)
+    except KeyError:
+        # Sparse matrices are shared as their CSR components
+        X = sparse.csr_matrix((shared_array(f'{variant}_data'), shared_array(f'{variant}_indices'),
+                               shared_array(f'{variant}_indptr')), shape=shared_array(f'{variant}_shape'))
+    y = shared_array('y')
+    train, test = shared_array('train'), shared_array('test')
+    X_train, X_test = X[train], X[test]
+
+    reset_peak_rss()
+    baseline = rss('VmRSS')
+    start = time.perf_counter()
+    clf.fit(X_train, y[train])
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    y_pred = clf.predict(X_test)
+    predict_time = time.perf_counter() - start
+    peak = rss('VmHWM') - baseline
+    return name, clf, y_pred, fit_time, predict_time, peak / 2 ** 20
+
+
+@profiled()
+def train_classifiers(classifiers, matrices, y, test_size=0.2, random_state=42, max_workers=None):
+    """
+    Fit and evaluate every classifier concurrently on one train/test split.
+
+    `classifiers` maps a name to (estimator, matrix name) and `matrices` maps
+    those names to design matrices (sparse or dense) with the same rows, e.g.
+    unscaled for Naive Bayes and scaled for the others. Returns (results, models): a frame of
+    weighted test-set metrics with fit/predict seconds and the peak memory (MB)
+    each fit and predict added to its worker, and the fitted estimators.
+    """
+    y = np.asarray(y)
+    train, test = train_test_split(np.arange(len(y)), test_size=test_size, random_state=random_state)
+    shared = {'y': y, 'train': train, 'test': test}
+    for variant, X in matrices.items():
+        if sparse.issparse(X):
+            X = sparse.csr_matrix(X)
+            shared.update({f'{variant}_data': X.data, f'{variant}_indices': X.indices,
+                           f'{variant}_indptr': X.indptr, f'{variant}_shape': X.shape})
+        else:
+            shared[variant] = np.asarray(X)
+
+    with process_pool(max_workers=max_workers, shared=shared) as pool:
+        futures = [pool.submit(_fit_classifier, name, clf, variant) for name, (clf, variant) in classifiers.items()]
+        fitted = [future.result() for future in futures]
+
+    results, models = {}, {}
+    for name, clf, y_pred, fit_time, predict_time, peak in fitted:
+        y_test = y[test]
+        models[name] = clf
+        results[name] = {
+            'Accuracy': accuracy_score(y_test, y_pred),
+            'Precision': precision_score(y_test, y_pred, average='weighted', zero_division=0),
+            'Recall': recall_score(y_test, y_pred, average='weighted', zero_division=0),
+            'F1-Score': f1_score(y_test, y_pred, average='weighted', zero_division=0),
+            'Fit (s)': fit_time,
+            'Predict (s)': predict_time,
+            'Peak memory (MB)': peak,
+        }
+    return pd.DataFrame(results).T, models
+
+
+# ==========================
+# Out-of-core training
+# ==========================
+
+def hash_features(frame, categorical, numeric, n_features=2 ** 12):
+    """
+    Fixed-width sparse design matrix that needs no vocabulary: every categorical
+    value is hashed (as 'column=value') into one of `n_features` columns, and the
+    `numeric` columns (missing -> 0) follow them. A value always lands in the
+    same column, so chunks can be encoded independently of each other.
+    """
+    n = len(frame)
+    rows, cols = [], []
+    for column in categorical:
+        codes, values = pd.factorize(frame[column].astype('string').fillna('MISSING'))
+        # Only the distinct values of the chunk are hashed
+        buckets = np.array([murmurhash3_32(f'{column}={value}', positive=True) % n_features for value in values],
+                           dtype='int64')
+        rows.append(np.arange(n))
+        cols.append(buckets[codes])
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    X_cat = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n_features))
+    X_cat.sum_duplicates()
+    X_num = sparse.csr_matrix(frame[list(numeric)].astype('float64').fillna(0).to_numpy())
+    return sparse.hstack([X_cat, X_num], format='csr')
+
+
+def stream_classes(make_chunks, target, threshold, other='OTHER'):
+    """
+    Target classes of a chunked dataset after collapsing the values seen
+    `threshold` times or fewer into `other`, from one pass over the target only.
+    Returns (classes, kept): the sorted class labels and the uncollapsed ones.
+    """
+    counts = None
+    for chunk in make_chunks():
+        chunk_counts = chunk[target].value_counts()
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+    kept = counts.index[counts > threshold]
+    classes = np.array(sorted(set(kept) | ({other} if (counts <= threshold).any() else set())), dtype=object)
+    return classes, kept
+
+
+def _weighted_scores(confusion):
+    """Accuracy and support-weighted precision/recall/F1 from a confusion matrix (zero_division=0)."""
+    true_positives = np.diag(confusion).astype('float64')
+    support = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        precision = np.where(predicted > 0, true_positives / predicted, 0.0)
+        recall = np.where(support > 0, true_positives / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    weights = support / support.sum()
+    return {
+        'Accuracy': true_positives.sum() / confusion.sum(),
+        'Precision': (precision * weights).sum(),
+        'Recall': (recall * weights).sum(),
+        'F1-Score': (f1 * weights).sum(),
+    }
+
+
+def train_streaming_classifiers(make_chunks, prepare, classifiers, classes, test_size=0.2, n_epochs=1, seed=42):
+    """
+    Train incremental classifiers (with `partial_fit`) over a chunked dataset
+    and evaluate them on a held-out stream.
+
+    `make_chunks()` returns a fresh iterator of DataFrame chunks and
+    `prepare(chunk)` turns a chunk into (X, y) with y drawn from `classes`.
+    Every row is held out for testing with probability `test_size`, from a
+    generator seeded with `seed`, so the split is the same in every pass; the
+    test rows are only predicted after training and are folded into a confusion
+    matrix, so memory is bounded by the chunk size. Returns (results, models)
+    with the same metric columns as `train_classifiers`, plus the row counts.
+    """
+    classes = np.asarray(classes)
+    class_codes = np.arange(len(classes))
+    fit_time = dict.fromkeys(classifiers, 0.0)
+    n_train = n_test = 0
+
+    for epoch in range(n_epochs):
+        rng = np.random.default_rng(seed)
+        for chunk in make_chunks():
+            X, y = prepare(chunk)
+            y = np.searchsorted(classes, y)
+            train = rng.random(len(y)) >= test_size
+            if not train.any():
+                continue
+            n_train += int(train.sum()) if epoch == 0 else 0
+            for name, clf in classifiers.items():
+                start = time.perf_counter()
+                clf.partial_fit(X[train], y[train], classes=class_codes)
+                fit_time[name] += time.perf_counter() - start
+
+    confusion = {name: np.zeros((len(classes), len(classes)), dtype='int64') for name in classifiers}
+    predict_time = dict.fromkeys(classifiers, 0.0)
+    rng = np.random.default_rng(seed)
+    for chunk in make_chunks():
+        X, y = prepare(chunk)
+        y = np.searchsorted(classes, y)
+        test = rng.random(len(y)) < test_size
+        if not test.any():
+            continue
+        n_test += int(test.sum())
+        for name, clf in classifiers.items():
+            start = time.perf_counter()
+            y_pred = clf.predict(X[test])
+            predict_time[name] += time.perf_counter() - start
+            confusion[name] += np.bincount(y[test] * len(classes) + y_pred,
+                                           minlength=len(classes) ** 2).reshape(len(classes), len(classes))
+
+    results = {
+        name: {**_weighted_scores(confusion[name]), 'Fit (s)': fit_time[name], 'Predict (s)': predict_time[name],
+               'Train rows': n_train, 'Test rows': n_test}
+        for name in classifiers
+    }
+    results = pd.DataFrame(results).T
+    return results.astype({'Train rows': 'int64', 'Test rows': 'int64'}), classifiers
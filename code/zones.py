@@ -0,0 +1,81 @@
+# Point-in-polygon zone assignment (precincts, NTAs, census tracts, ...).
+# Complaints and permits are tagged with the ID of the polygon of a local
+# shapefile/GeoJSON layer they fall in. The polygons are indexed once in an STRtree
+# and all points are matched in a single bulk query with a vectorized predicate.
+# Assignments are cached on disk per (coordinates, layer), so the scripts can group
+# by fine zones without repeating the join on every run.
+
+import hashlib
+import os
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from store import DATA_DIR, DATASETS
+from profiling import profiled
+
+ZONE_CACHE_DIR = os.path.join(DATA_DIR, 'cache', 'zones')
+
+
+def load_layer(path, id_column):
+    """Polygon layer (shapefile, GeoJSON, ...) in lon/lat with only `id_column` and the geometry."""
+    layer = gpd.read_file(path)
+    if layer.crs is not None and layer.crs.to_epsg() != 4326:
+        layer = layer.to_crs('EPSG:4326')
+    return layer[[id_column, 'geometry']].reset_index(drop=True)
+
+
+def layer_hash(layer, id_column):
+    """Content hash of a layer's zone IDs and geometries, whatever file format it came from."""
+    digest = hashlib.sha1(id_column.encode())
+    digest.update(pd.util.hash_pandas_object(layer[id_column].astype('string'), index=False).to_numpy().tobytes())
+    digest.update(b''.join(shapely.to_wkb(layer.geometry.values)))
+    return digest.hexdigest()
+
+
+@profiled()
+def assign_zones(lon, lat, geometries):
+    """
+    Index of the polygon in `geometries` containing each point, or -1 for points
+    outside every polygon or without coordinates. Points on a border shared by
+    several polygons go to the first of them.
+    """
+    lon = np.asarray(lon, dtype='float64')
+    lat = np.asarray(lat, dtype='float64')
+    valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+    tree = shapely.STRtree(np.asarray(geometries))
+    point_idx, polygon_idx = tree.query(shapely.points(lon[valid], lat[valid]), predicate='intersects')
+
+    # Keep the lowest polygon index per point
+    order = np.lexsort((polygon_idx, point_idx))
+    first = np.unique(point_idx[order], return_index=True)[1]
+    zone = np.full(len(lon), -1, dtype='int32')
+    zone[valid[point_idx[order][first]]] = polygon_idx[order][first]
+    return zone
+
+
+def zone_column(frame, dataset, layer, id_column, cache=True):
+    """
+    Zone ID of every row of `frame` (rows of `dataset`, e.g. from load_dataset)
+    as a categorical Series aligned with it, missing where a row falls outside
+    the layer. The assignment is cached in data/cache/zones, keyed on the row
+    coordinates and the layer content.
+    """
+    lat_col, lon_col = DATASETS[dataset]['coordinate_columns']
+    coords = frame[[lon_col, lat_col]]
+    digest = hashlib.sha1(pd.util.hash_pandas_object(coords, index=False).to_numpy().tobytes())
+    digest.update(layer_hash(layer, id_column).encode())
+    path = os.path.join(ZONE_CACHE_DIR, f'{dataset}_{id_column}_{digest.hexdigest()}.npy')
+
+    if cache and os.path.exists(path):
+        zone = np.load(path)
+    else:
+        zone = assign_zones(coords[lon_col], coords[lat_col], layer.geometry.values)
+        if cache:
+            os.makedirs(ZONE_CACHE_DIR, exist_ok=True)
+            np.save(path, zone)
+
+    # Several polygons may share an ID (multi-part zones), so codes go through the distinct IDs
+    id_codes, ids = pd.factorize(layer[id_column], sort=True)
+    codes = np.where(zone >= 0, id_codes[np.maximum(zone, 0)], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=ids), index=frame.index, name=id_column)